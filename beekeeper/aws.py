@@ -1,14 +1,29 @@
 import operator
 import click
+import calendar
+import time
 import datetime
 import boto3
 import arrow
 import json
 import beekeeper
+import transport
 import base64
 import os
 import urllib2
-import glob
+import threading
+
+# Spot request status codes which mean AWS reclaimed, or is about to reclaim, a worker
+# See http://docs.aws.amazon.com/AWSEC2/latest/UserGuide/spot-bid-status.html
+spot_interruption_codes = [
+    'marked-for-termination', 'marked-for-stop', 'instance-terminated-by-price', 'instance-terminated-no-capacity',
+    'instance-terminated-capacity-oversubscribed', 'instance-terminated-launch-group-constraint',
+    'instance-stopped-by-price', 'instance-stopped-no-capacity', 'instance-terminated-by-service'
+]
+
+# Status codes of open spot requests which AWS cannot fulfill for lack of capacity. In a run spanning several regions
+# such requests are moved to another region
+spot_capacity_codes = ['capacity-not-available', 'capacity-oversubscribed']
 
 class AWS(beekeeper.Beekeeper):
     """Class to handle AWS API calls. Inherits from beekeeper.Beekeeper class"""
@@ -23,6 +38,65 @@ class AWS(beekeeper.Beekeeper):
             region_name = self.aws_region
         )
 
+        # Clients are created once per service and region and reused by every call within the same run
+        self.clients = {}
+        self.clients_lock = threading.Lock()
+
+    def share_clients(self, other):
+        """Use the boto3 session and clients of another profile with the same AWS credentials
+
+        Args:
+            other (object): aws.AWS object of the other profile
+        """
+
+        self.boto3 = other.boto3
+        self.clients = other.clients
+        self.clients_lock = other.clients_lock
+
+    def client(self, service_name, region_name=None):
+        """Get a boto3 client which is shared within the same run
+
+        Args:
+            service_name (str): AWS service i.e. ec2, sqs or s3
+            region_name (str): AWS region code. Default to the region of the profile
+
+        Returns:
+            object: boto3 client
+        """
+
+        # boto3 sessions are not thread-safe, so clients are created under a lock. The clients themselves are
+        # thread-safe and are shared by all threads once created
+        key = (service_name, region_name or self.aws_region)
+        with self.clients_lock:
+            if key not in self.clients:
+                self.clients[key] = self.boto3.client(service_name, region_name=key[1])
+        return self.clients[key]
+
+    def from_cache(self, key):
+        """Get a memoized response from the run cache and count the AWS call it saved
+
+        Args:
+            key: cache key i.e. instance
+
+        Returns:
+            object: the memoized response
+        """
+
+        self.calls_saved += 1
+        return self.cache[key]
+
+    def invalidate(self, *keys):
+        """Remove memoized responses from the run cache i.e. after the master instance was started or stopped
+
+        Args:
+            *keys: cache keys to remove. Everything is removed if no key is given
+        """
+
+        if not keys:
+            self.cache.clear()
+        for key in keys:
+            self.cache.pop(key, None)
+
     def get_instance(self):
         """Get basic instance info
 
@@ -30,12 +104,12 @@ class AWS(beekeeper.Beekeeper):
             dict: instance attributes
         """
 
-        # Check if this method was already run within the same command input. If so, get the instance status from self
-        if self.instance:
-            return self.instance
+        # Check if this method was already run within the same run. If so, get the instance status from the run cache
+        if 'instance' in self.cache:
+            return self.from_cache('instance')
 
         try:
-            client = self.boto3.client('ec2')
+            client = self.client('ec2')
             response = client.describe_instances(InstanceIds=[self.aws_instance_id])
             if response['Reservations'][0]['Instances'][0]:
                 results = self.parse_instance_result(response['Reservations'][0]['Instances'][0])
@@ -45,8 +119,8 @@ class AWS(beekeeper.Beekeeper):
                 if volume:
                     results['volume_size'] = volume['Volumes'][0]['Size']
 
-                # Cache the status result in self in case this method is called again from within the same command input
-                self.instance = results
+                # Cache the status result in case this method is called again from within the same run
+                self.cache['instance'] = results
                 return results
             else:
                 return None
@@ -63,7 +137,7 @@ class AWS(beekeeper.Beekeeper):
             list: of instance dictionary objects
         """
         try:
-            client = self.boto3.client('ec2', region_name=region)
+            client = self.client('ec2', region)
             response = client.describe_instances()
             results = []
             for reservation in response['Reservations']:
@@ -75,8 +149,9 @@ class AWS(beekeeper.Beekeeper):
 
     def start_instance(self):
         """Start an instance"""
+        self.invalidate('instance')
         try:
-            client = self.boto3.client('ec2')
+            client = self.client('ec2')
             response = client.start_instances(
                 InstanceIds=[self.aws_instance_id]
             )
@@ -89,8 +164,9 @@ class AWS(beekeeper.Beekeeper):
     def stop_instance(self):
         """Stop an instance"""
         # TODO Make sure no tests are running before stopping an instance
+        self.invalidate('instance')
         try:
-            client = self.boto3.client('ec2')
+            client = self.client('ec2')
             response = client.stop_instances(
                 InstanceIds=[self.aws_instance_id]
             )
@@ -99,16 +175,22 @@ class AWS(beekeeper.Beekeeper):
         except Exception as e:
             self.log_error(e)
 
-    def get_snapshot(self):
+    def get_snapshot(self, image_id=None, region=None):
         """Get the most current AMI image
 
+        Args:
+            image_id (str): get this AMI image instead of the most current one
+            region (str): region of the image. Default to the region of the profile
+
         Returns:
             dict: snapshot attributes
         """
 
-        client = self.boto3.client('ec2')
-        response = client.describe_images(
-            Filters=[{'Name': 'tag:beekeeper_instance_id', 'Values': [self.aws_instance_id]}])
+        client = self.client('ec2', region)
+        filters = [{'Name': 'tag:beekeeper_instance_id', 'Values': [self.aws_instance_id]}]
+        if image_id:
+            filters.append({'Name': 'image-id', 'Values': [image_id]})
+        response = client.describe_images(Filters=filters)
 
         if not response['Images']:
             return None
@@ -134,7 +216,7 @@ class AWS(beekeeper.Beekeeper):
     def get_task_queue(self, image_id):
         """Get current task queue"""
         try:
-            client = boto3.client('sqs')
+            client = self.client('sqs')
 
             # Get queue URL
             queue_name = "beeworker_task_" + image_id
@@ -161,6 +243,31 @@ class AWS(beekeeper.Beekeeper):
         except Exception as e:
             self.log_error(e)
 
+    def count_waiting_tasks(self, image_id):
+        """Count the tasks of a run which are waiting in its task and priority queues or are in flight on a worker
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+
+        Returns:
+            int: number of tasks
+        """
+
+        count = 0
+        queue = self.get_task_queue(image_id)
+        if queue:
+            count += int(queue['message_count']) + int(queue['message_in_process'])
+
+        priority_url = self.get_priority_queue_url(image_id)
+        if priority_url:
+            response = self.client('sqs').get_queue_attributes(
+                QueueUrl = priority_url,
+                AttributeNames = ['ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible']
+            )
+            count += int(response['Attributes']['ApproximateNumberOfMessages']) \
+                + int(response['Attributes']['ApproximateNumberOfMessagesNotVisible'])
+        return count
+
     def parse_instance_result(self, instance):
         """Helper function to parses the AWS describe_instance() response into a simplier structure for beekeeper purposes"""
 
@@ -180,11 +287,16 @@ class AWS(beekeeper.Beekeeper):
         }
         return result
 
-    def create_snapshot(self):
-        """Create an AMI image of an instance"""
+    def create_snapshot(self, wait=True, fast_restore=False):
+        """Create an AMI image of an instance
+
+        Args:
+            wait (bool): wait for the image to be available before returning
+            fast_restore (bool): enable fast snapshot restore once the image is available. Requires wait
+        """
         try:
             # Create AMI image
-            client = self.boto3.client('ec2')
+            client = self.client('ec2')
             image = client.create_image(
                 InstanceId = self.aws_instance_id,
                 Name = 'Beekeeper ' + self.timestamp("%Y%m%d%H%M%S"),   # returns a timestamp suitable as an image name i.e. no hyphens
@@ -198,46 +310,212 @@ class AWS(beekeeper.Beekeeper):
                 Tags = [{'Key': 'beekeeper_instance_id', 'Value': self.aws_instance_id}])
 
             # Wait for image to be ready before returning
-            waiter = client.get_waiter('image_available')
-            waiter.wait(ImageIds=[image['ImageId']])
+            if wait:
+                self.wait_for_snapshot(image['ImageId'])
+                if fast_restore:
+                    self.enable_fast_restore(image['ImageId'])
             return image
 
         except Exception as e:
             self.log_error(e)
 
-    def create_task_queue(self, features, image_id):
-        """Create a SQS task queue and populate the queue with a list of tasks"""
+    def wait_for_snapshot(self, image_id, region=None):
+        """Wait for an AMI image to be available"""
+        client = self.client('ec2', region)
+        waiter = client.get_waiter('image_available')
+        waiter.wait(ImageIds=[image_id])
+
+    def enable_fast_restore(self, image_id, timeout=0):
+        """Enable fast snapshot restore on the snapshot of a run in the availability zone of the master instance
+
+        Volumes created from a snapshot normally load their blocks from S3 on first access, so the first Behat run and
+        the first database queries on a fresh worker are slow. Fast snapshot restore creates fully initialized volumes
+        instead. AWS charges for every hour it is enabled, so cleanup disables it again.
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            timeout (int): seconds to wait for fast snapshot restore to become enabled
+
+        Returns:
+            str: state of fast snapshot restore i.e. enabling, optimizing or enabled
+        """
+
+        try:
+            client = self.client('ec2')
+            snapshot_id = self.get_snapshot(image_id)['snapshot_id']
+            availability_zone = self.get_instance()['availability_zone']
+            response = client.enable_fast_snapshot_restores(
+                AvailabilityZones = [availability_zone],
+                SourceSnapshotIds = [snapshot_id]
+            )
+            state = response['Successful'][0]['State'] if response['Successful'] else None
+
+            # Enabling takes about a minute per 16 GB of snapshot data. Volumes only benefit once it is enabled
+            deadline = time.time() + timeout
+            while state and state != 'enabled' and time.time() < deadline:
+                time.sleep(10)
+                response = client.describe_fast_snapshot_restores(
+                    Filters = [{'Name': 'snapshot-id', 'Values': [snapshot_id]}]
+                )
+                states = [restore['State'] for restore in response['FastSnapshotRestores']
+                    if restore['AvailabilityZone'] == availability_zone]
+                state = states[0] if states else None
+            return state
+
+        except Exception as e:
+            self.log_error(e)
+
+    def disable_fast_restore(self, snapshot_id, region=None):
+        """Disable fast snapshot restore on a snapshot in every availability zone it is enabled in
+
+        Args:
+            snapshot_id (str): id of the snapshot
+            region (str): region of the snapshot. Default to the region of the profile
+        """
+
+        # Failing here i.e. without permission to describe fast snapshot restores must not keep the snapshot from
+        # being deleted
         try:
-            client = self.boto3.client('sqs')
+            client = self.client('ec2', region)
+            response = client.describe_fast_snapshot_restores(
+                Filters = [{'Name': 'snapshot-id', 'Values': [snapshot_id]}]
+            )
+            availability_zones = [restore['AvailabilityZone'] for restore in response['FastSnapshotRestores']
+                if restore['State'] not in ('disabling', 'disabled')]
+            if availability_zones:
+                client.disable_fast_snapshot_restores(
+                    AvailabilityZones = availability_zones,
+                    SourceSnapshotIds = [snapshot_id]
+                )
+                click.echo("Disabled fast snapshot restore: %s" % snapshot_id)
 
-            # Create the queue
-            queue_name = "beeworker_task_%s" % image_id
+        except Exception as e:
+            self.log_error(e)
+
+    def copy_image_to_regions(self, image_id, regions):
+        """Start copying the AMI image of a run to other regions
+
+        The copies are not available straight away. Use wait_for_snapshot() with the region before launching workers.
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            regions (list): of region codes
+
+        Returns:
+            dict: region to the image id of the copy. Regions the image could not be copied to are left out
+        """
+
+        copies = {}
+        for region in regions:
+            try:
+                client = self.client('ec2', region)
+                image = client.copy_image(
+                    SourceRegion = self.aws_region,
+                    SourceImageId = image_id,
+                    Name = 'Beekeeper %s %s' % (self.timestamp("%Y%m%d%H%M%S"), image_id),
+                    Description = 'Copy of %s created by Beekeeper on %s' % (image_id, self.timestamp())
+                )
+
+                # Tag the copy like the original so cleanup can find its snapshot
+                client.create_tags(
+                    Resources = [image['ImageId']],
+                    Tags = [{'Key': 'beekeeper_instance_id', 'Value': self.aws_instance_id}])
+                copies[region] = image['ImageId']
+
+            except Exception as e:
+                self.log_error(e)
+        return copies
+
+    def create_task_queue(self, tasks, image_id):
+        """Create a SQS task queue and populate the queue with a list of tasks
+
+        Args:
+            tasks (list): of tasks, each a list of one or more feature files to run together
+            image_id (str): image_id of a Beekeeper run
+        """
+        try:
+            client = self.client('sqs')
+
+            # Create a dead-letter queue to hold tasks which keep failing to complete i.e. crashing or hanging Behat
             response = client.create_queue(
-                QueueName= queue_name,
-                Attributes={
-                    'MaximumMessageSize': '1024',
-                    'ReceiveMessageWaitTimeSeconds': '20',
-                    'VisibilityTimeout' : self.timeout           # number of seconds to allow a task to run before being deleted
+                QueueName = "beeworker_dlq_%s" % image_id,
+                Attributes = {
+                    'MessageRetentionPeriod': '1209600'         # keep dead-lettered tasks for the maximum of 14 days
                 }
             )
-            queue_url = response['QueueUrl']
 
-            # Create tasks in the queue
-            for feature in features:
-                response = client.send_message(
-                    QueueUrl = queue_url,
-                    MessageBody = feature,
-                )
+            # Create the queue
+            return self.fill_queue("beeworker_task_%s" % image_id, tasks, response['QueueUrl'])
 
-            return queue_url
+        except Exception as e:
+            self.log_error(e)
+
+    def create_priority_queue(self, tasks, image_id):
+        """Create the SQS priority queue of a run, which workers drain before the task queue, and populate it
+
+        Call create_task_queue() first. Tasks which keep failing go to the same dead-letter queue.
+
+        Args:
+            tasks (list): of tasks of the critical lane, each a list of one or more feature files to run together
+            image_id (str): image_id of a Beekeeper run
+        """
+        try:
+            client = self.client('sqs')
+            response = client.get_queue_url(QueueName = "beeworker_dlq_%s" % image_id)
+            return self.fill_queue("beeworker_priority_%s" % image_id, tasks, response['QueueUrl'])
 
         except Exception as e:
             self.log_error(e)
 
+    def fill_queue(self, queue_name, tasks, dlq_url):
+        """Create a queue of tasks which are moved to a dead-letter queue once they exceed their retry budget
+
+        Args:
+            queue_name (str): name of the queue i.e. beeworker_task_ami-1234abcd
+            tasks (list): of tasks, each a list of one or more feature files to run together
+            dlq_url (str): URL of the dead-letter queue
+
+        Returns:
+            str: URL of the queue
+        """
+
+        client = self.client('sqs')
+        response = client.get_queue_attributes(
+            QueueUrl = dlq_url,
+            AttributeNames = ['QueueArn']
+        )
+        redrive_policy = {
+            'deadLetterTargetArn': response['Attributes']['QueueArn'],
+            'maxReceiveCount': str(self.max_receive_count)  # number of attempts before a task is dead-lettered
+        }
+
+        # A task packed with several feature files is allowed the timeout of each of them, up to the SQS limit of 12 hours
+        visibility_timeout = min(int(self.timeout) * max([len(task) for task in tasks] + [1]), 43200)
+
+        response = client.create_queue(
+            QueueName= queue_name,
+            Attributes={
+                'MaximumMessageSize': '65536',                # large enough for tasks packed with many feature files
+                'ReceiveMessageWaitTimeSeconds': '20',
+                'VisibilityTimeout' : str(visibility_timeout),   # number of seconds to allow a task to run before being deleted
+                'RedrivePolicy': json.dumps(redrive_policy)
+            }
+        )
+        queue_url = response['QueueUrl']
+
+        # Create tasks in the queue. The feature files of a task are separated by a new line
+        for task in tasks:
+            response = client.send_message(
+                QueueUrl = queue_url,
+                MessageBody = '\n'.join(task),
+            )
+
+        return queue_url
+
     def create_result_bucket(self, image_id, result_count):
         """Create a S3 result folder within the beekeeper bucket"""
         try:
-            client = self.boto3.client('s3')
+            client = self.client('s3')
             bucket_name = "beekeeper-%s" % image_id
             response = client.create_bucket(Bucket = bucket_name)
 
@@ -257,38 +535,40 @@ class AWS(beekeeper.Beekeeper):
             self.log_error(e)
 
 
-    def create_spot_instances(self, image_id, max_workers, max_bid_price, sqs_task_queue_url, s3_result_bucket_name, debug):
-        """Create worker instances"""
+    def create_spot_instances(self, image_id, max_workers, max_bid_price, sqs_task_queue_url, s3_result_bucket_name, debug,
+                              batched_tasks=False, slots=1, instance_type=None, region=None, pool_fingerprint=None,
+                              sqs_priority_queue_url=None):
+        """Create worker instances
+
+        Workers in a region other than the one of the profile use the copy of the image in that region and share the task
+        queue and result bucket of the run. Workers requested to join the warm pool use persistent spot requests which
+        stop rather than terminate the worker, and are parked in the pool by cleanup.
+        """
         try:
-            # Setup user meta data
-            user_data = {
-                "sqs_task_queue_url": sqs_task_queue_url,
-                "s3_result_bucket_name": s3_result_bucket_name,
-                "master_instance_id": self.aws_instance_id,
-                "behat_project_folder": self.behat_project_folder,
-                "auto_shutdown": not debug,
-                "timeout": self.timeout
-            }
+            # Setup user meta data. Workers joining the pool are stopped by Beekeeper instead of shutting down
+            user_data = self.get_user_data(sqs_task_queue_url, s3_result_bucket_name, debug or bool(pool_fingerprint),
+                batched_tasks, slots, sqs_priority_queue_url)
             user_data_base64 = base64.b64encode(json.dumps(user_data))
 
+            request = {
+                'DryRun': False,
+                'SpotPrice': str(max_bid_price),
+                'InstanceCount': max_workers,
+                'Type': 'one-time',
+                'LaunchSpecification': self.get_launch_specification(image_id, user_data_base64,
+                    instance_type or self.get_worker_instance_type(), region)
+            }
+            if pool_fingerprint:
+                request['Type'] = 'persistent'
+                request['InstanceInterruptionBehavior'] = 'stop'
+                request['TagSpecifications'] = [{
+                    'ResourceType': 'spot-instances-request',
+                    'Tags': [{'Key': 'beekeeper_fingerprint', 'Value': pool_fingerprint}]
+                }]
+
             # Create spot instances
-            client = self.boto3.client('ec2')
-            instance = self.get_instance()
-            response = client.request_spot_instances(
-                DryRun = False,
-                SpotPrice = str(max_bid_price),
-                InstanceCount = max_workers,
-                Type = 'one-time',
-                LaunchSpecification={
-                    'ImageId': image_id,
-                    'KeyName': instance['key_name'],
-                    'UserData': user_data_base64,
-                    'SubnetId': instance['subnet_id'],
-                    'InstanceType': instance['instance_type'],
-                    'Monitoring': {'Enabled': False},
-                    'SecurityGroupIds' : [instance['security_group_id']]
-                },
-            )
+            client = self.client('ec2', region)
+            response = client.request_spot_instances(**request)
 
             # Wait for instances to be running
             waiter = client.get_waiter('instance_running')
@@ -303,19 +583,611 @@ class AWS(beekeeper.Beekeeper):
         except Exception as e:
             self.log_error(e)
 
-    def get_spot_instance_price(self):
-        """Get the current spot instance price"""
+    def get_user_data(self, sqs_task_queue_url, s3_result_bucket_name, debug, batched_tasks=False, slots=1,
+                      sqs_priority_queue_url=None):
+        """Get the user data which tells a worker what to do
 
-        try:
-            client = self.boto3.client('ec2')
+        Returns:
+            dict: user data of a worker of the run
+        """
+
+        return {
+            "sqs_task_queue_url": sqs_task_queue_url,
+            "sqs_priority_queue_url": sqs_priority_queue_url,   # drained before the task queue. None without one
+            "s3_result_bucket_name": s3_result_bucket_name,
+            "master_instance_id": self.aws_instance_id,
+            "behat_project_folder": self.behat_project_folder,
+            "auto_shutdown": not debug,
+            "timeout": self.timeout,
+            "batched_tasks": batched_tasks,     # tasks may contain several feature files, one per line
+            "report_in_flight": True,           # store the receipt handle of the current task in inflight/<instance id>
+            "result_transport": self.get_result_transport(),
+            "slots": slots,                     # number of tasks a worker runs at once, each in its own Behat process
+            "aws_region": self.aws_region,      # region of the task queue and result bucket
+            "prewarm_paths": [path.strip() for path in self.prewarm_paths.split(',') if path.strip()],
+            "result_metadata": True             # store the instance id of the worker in x-amz-meta-instance-id
+        }
+
+    def get_launch_specification(self, image_id, user_data_base64, instance_type, region=None):
+        """Get the launch specification of a worker
+
+        Args:
+            image_id (str): image id in the region of the worker
+            user_data_base64 (str): encoded user data of the worker
+            instance_type (str): instance type of the worker
+            region (str): region of the worker. Default to the region of the profile
+
+        Returns:
+            dict: LaunchSpecification of a spot request
+        """
+
+        specification = {
+            'ImageId': image_id,
+            'UserData': user_data_base64,
+            'InstanceType': instance_type,
+            'Monitoring': {'Enabled': False}
+        }
+
+        # Key pairs, subnets and security groups belong to a region. Workers in other regions use the default VPC
+        if not region or region == self.aws_region:
             instance = self.get_instance()
+            specification['KeyName'] = instance['key_name']
+            specification['SubnetId'] = instance['subnet_id']
+            specification['SecurityGroupIds'] = [instance['security_group_id']]
+        return specification
+
+    def purge_task_queue(self, image_id):
+        """Delete all remaining tasks from the task queue and the priority queue of a run"""
+        try:
+            client = self.client('sqs')
+            response = client.get_queue_url(QueueName = "beeworker_task_" + image_id)
+            client.purge_queue(QueueUrl = response['QueueUrl'])
+
+            queue_url = self.get_priority_queue_url(image_id)
+            if queue_url:
+                client.purge_queue(QueueUrl = queue_url)
+
+        except Exception as e:
+            self.log_error(e)
+
+    def get_priority_queue_url(self, image_id):
+        """Get the URL of the priority queue of a run
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+
+        Returns:
+            str: URL of the queue or None if the run has no critical lane
+        """
+
+        client = self.client('sqs')
+        try:
+            return client.get_queue_url(QueueName = "beeworker_priority_" + image_id)['QueueUrl']
+        except client.exceptions.QueueDoesNotExist:
+            return None
+
+    def terminate_workers(self, image_id):
+        """Cancel the spot instance requests of a run and terminate its worker instances in every region of the run
+
+        Returns:
+            list: of terminated instance ids
+        """
+        try:
+            terminated = []
+            for region, regional_image_id in sorted(self.get_regions(image_id).items()):
+                client = self.client('ec2', region)
+
+                # Cancel the spot requests first so they are not fulfilled again
+                response = client.describe_spot_instance_requests(
+                    Filters = [
+                        {'Name': 'launch.image-id', 'Values': [regional_image_id]},
+                        {'Name': 'state', 'Values': ['open', 'active']},
+                    ]
+                )
+                request_ids = [request['SpotInstanceRequestId'] for request in response['SpotInstanceRequests']]
+                if request_ids:
+                    client.cancel_spot_instance_requests(SpotInstanceRequestIds = request_ids)
+
+                response = client.describe_instances(
+                    Filters = [
+                        {'Name': 'image-id', 'Values': [regional_image_id]},
+                        {'Name': 'instance-state-name', 'Values': ['pending', 'running']},
+                    ]
+                )
+                instance_ids = [instance['InstanceId'] for reservation in response['Reservations']
+                    for instance in reservation['Instances']]
+                if instance_ids:
+                    client.terminate_instances(InstanceIds = instance_ids)
+                terminated.extend(instance_ids)
+
+            return terminated
+
+        except Exception as e:
+            self.log_error(e)
+
+    def count_active_workers(self, image_id):
+        """Count the workers of a run which are running in every region of the run
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+
+        Returns:
+            int: number of running workers
+        """
+
+        try:
+            workers = 0
+            for region, regional_image_id in self.get_regions(image_id).items():
+                response = self.client('ec2', region).describe_instances(
+                    Filters = [
+                        {'Name': 'image-id', 'Values': [regional_image_id]},
+                        {'Name': 'instance-state-name', 'Values': ['running']},
+                    ]
+                )
+                workers += sum([len(reservation['Instances']) for reservation in response['Reservations']])
+
+            # Workers started from the warm pool were built from the image of an earlier run
+            response = self.client('ec2').describe_instances(
+                Filters = [
+                    {'Name': 'tag:beekeeper_run', 'Values': [image_id]},
+                    {'Name': 'instance-state-name', 'Values': ['running']},
+                ]
+            )
+            workers += sum([len(reservation['Instances']) for reservation in response['Reservations']])
+            return workers
+
+        except Exception as e:
+            self.log_error(e)
+            return 0
+
+    def find_interruptions(self, spot_requests, handled, tasks_waiting):
+        """Find the spot requests of a run whose worker was interrupted or terminated early
+
+        Args:
+            spot_requests (list): SpotInstanceRequests from a describe_spot_instance_requests() response
+            handled (set): ids of spot requests which were already replaced
+            tasks_waiting (bool): True if the task or priority queue still has tasks waiting or in flight
+
+        Returns:
+            list: of interrupted spot requests
+        """
+
+        interrupted = []
+        for request in spot_requests:
+            if request['SpotInstanceRequestId'] in handled:
+                continue
+
+            # Only AWS interrupting a worker counts. Workers shut themselves down once the queues are empty, which
+            # can overlap with a task becoming visible again at the end of a run. A worker interrupted once every task
+            # is done has nothing left to hand over
+            if request['Status']['Code'] in spot_interruption_codes and tasks_waiting:
+                interrupted.append(request)
+        return interrupted
+
+    def replace_interrupted_workers(self, image_id):
+        """Detect interrupted workers of a run, make their in-flight task visible again and request replacements
+
+        In a run spanning several regions, spot requests which cannot be fulfilled for lack of capacity are moved to
+        another region of the run.
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+
+        Returns:
+            list: of interruptions as recorded by record_interruption()
+        """
+
+        try:
+            handled = set([interruption['request_id'] for interruption in self.get_interruptions(image_id, None)])
+            tasks_waiting = self.count_waiting_tasks(image_id) > 0
+
+            regions = self.get_regions(image_id)
+            interruptions = []
+            for region, regional_image_id in sorted(regions.items()):
+                client = self.client('ec2', region)
+                response = client.describe_spot_instance_requests(
+                    Filters = [{'Name': 'launch.image-id', 'Values': [regional_image_id]}]
+                )
+
+                for request in self.find_interruptions(response['SpotInstanceRequests'], handled, tasks_waiting):
+                    if request.get('InstanceId'):
+                        self.release_in_flight_task(image_id, request['InstanceId'])
+                    # AWS starts the workers of persistent spot requests, which join the warm pool, again by itself
+                    replacement_id = None
+                    if request.get('Type') != 'persistent':
+                        replacement_id = self.replace_spot_request(request, region)
+                    interruptions.append(self.record_interruption(image_id, request, replacement_id))
+
+                if len(regions) < 2:
+                    continue
+                for request in response['SpotInstanceRequests']:
+                    if request['SpotInstanceRequestId'] in handled or request['State'] != 'open' \
+                            or request['Status']['Code'] not in spot_capacity_codes:
+                        continue
+                    client.cancel_spot_instance_requests(SpotInstanceRequestIds = [request['SpotInstanceRequestId']])
+                    target, replacement_id = self.move_spot_request(request, region, regions)
+                    interruptions.append(self.record_interruption(image_id, request, replacement_id, 'capacity_move',
+                        target))
+            return interruptions
+
+        except Exception as e:
+            self.log_error(e)
+            return []
+
+    def release_in_flight_task(self, image_id, instance_id):
+        """Make the task a worker was processing visible again in the task queue
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            instance_id (str): instance id of the worker
+
+        Returns:
+            bool: True if a task was released
+        """
+
+        client = self.client('s3')
+        bucket_name = 'beekeeper-' + image_id
+        key = 'inflight/' + instance_id
+
+        # Workers store the receipt handle of the task they are processing in the result bucket
+        try:
+            response = client.get_object(Bucket = bucket_name, Key = key)
+            receipt_handle = response['Body'].read().strip()
+        except Exception as e:
+            return False
+
+        # The task came from either the priority queue or the task queue, and a receipt handle only works for its own
+        released = False
+        sqs = self.client('sqs')
+        for queue_name in ("beeworker_priority_" + image_id, "beeworker_task_" + image_id):
+            try:
+                response = sqs.get_queue_url(QueueName = queue_name)
+                sqs.change_message_visibility(
+                    QueueUrl = response['QueueUrl'],
+                    ReceiptHandle = receipt_handle,
+                    VisibilityTimeout = 0
+                )
+                released = True
+                break
+            except Exception as e:
+                # The task may have been completed or timed out already
+                continue
+
+        client.delete_object(Bucket = bucket_name, Key = key)
+        return released
+
+    def replace_spot_request(self, request, region=None):
+        """Request a replacement worker using the launch specification of an interrupted spot request
+
+        Args:
+            request (dict): spot request from a describe_spot_instance_requests() response
+            region (str): region of the spot request. Default to the region of the profile
+
+        Returns:
+            str: id of the replacement spot request
+        """
+
+        specification = request['LaunchSpecification']
+        launch_specification = {
+            'ImageId': specification['ImageId'],
+            'UserData': specification['UserData'],
+            'InstanceType': specification['InstanceType'],
+            'Monitoring': {'Enabled': False},
+            'SecurityGroupIds': [group['GroupId'] for group in specification.get('SecurityGroups', [])]
+        }
+        if specification.get('KeyName'):
+            launch_specification['KeyName'] = specification['KeyName']
+        if specification.get('SubnetId'):
+            launch_specification['SubnetId'] = specification['SubnetId']
+
+        client = self.client('ec2', region)
+        response = client.request_spot_instances(
+            SpotPrice = request['SpotPrice'],
+            InstanceCount = 1,
+            Type = 'one-time',
+            LaunchSpecification = launch_specification
+        )
+        return response['SpotInstanceRequests'][0]['SpotInstanceRequestId']
+
+    def move_spot_request(self, request, region, regions):
+        """Request a worker in the next region of a run instead of a spot request which cannot be fulfilled
+
+        Args:
+            request (dict): spot request from a describe_spot_instance_requests() response
+            region (str): region of the spot request
+            regions (dict): region to image id of every region of the run
+
+        Returns:
+            tuple: region and id of the new spot request
+        """
+
+        ordered = sorted(regions)
+        target = ordered[(ordered.index(region) + 1) % len(ordered)]
+        specification = request['LaunchSpecification']
+
+        client = self.client('ec2', target)
+        response = client.request_spot_instances(
+            SpotPrice = request['SpotPrice'],
+            InstanceCount = 1,
+            Type = 'one-time',
+            LaunchSpecification = self.get_launch_specification(regions[target], specification['UserData'],
+                specification['InstanceType'], target)
+        )
+        return target, response['SpotInstanceRequests'][0]['SpotInstanceRequestId']
+
+    def get_pool(self):
+        """Get the workers in the warm pool of the master instance
+
+        Returns:
+            list: of dicts with the instance id, state, fingerprint, last run, time last used, availability zone, root
+                  device and volume of each pooled worker
+        """
+
+        try:
+            client = self.client('ec2')
+            response = client.describe_instances(
+                Filters = [
+                    {'Name': 'tag:beekeeper_pool', 'Values': [self.aws_instance_id]},
+                    {'Name': 'instance-state-name', 'Values': ['pending', 'running', 'stopping', 'stopped']},
+                ]
+            )
+
+            pool = []
+            for reservation in response['Reservations']:
+                for instance in reservation['Instances']:
+                    tags = instance.get('Tags', [])
+                    root = [mapping['Ebs']['VolumeId'] for mapping in instance['BlockDeviceMappings']
+                        if mapping['DeviceName'] == instance['RootDeviceName']]
+                    last_used = self.get_tag_value(tags, 'beekeeper_last_used')
+                    pool.append({
+                        'instance_id': instance['InstanceId'],
+                        'state': instance['State']['Name'],
+                        'fingerprint': self.get_tag_value(tags, 'beekeeper_fingerprint'),
+                        'run': self.get_tag_value(tags, 'beekeeper_run'),
+                        'last_used': float(last_used) if last_used else calendar.timegm(instance['LaunchTime'].utctimetuple()),
+                        'availability_zone': instance['Placement']['AvailabilityZone'],
+                        'root_device': instance['RootDeviceName'],
+                        'volume_id': root[0] if root else None,
+                        'spot_request_id': instance.get('SpotInstanceRequestId')
+                    })
+
+            # Add the size of the volumes which are paid for while the workers are stopped
+            volume_ids = [worker['volume_id'] for worker in pool if worker['volume_id']]
+            sizes = {}
+            if volume_ids:
+                response = client.describe_volumes(VolumeIds = volume_ids)
+                sizes = dict([(volume['VolumeId'], volume['Size']) for volume in response['Volumes']])
+            for worker in pool:
+                worker['volume_size'] = sizes.get(worker['volume_id'], 0)
+            return pool
+
+        except Exception as e:
+            self.log_error(e)
+            return []
+
+    def expire_pool(self, ttl_hours):
+        """Drain the stopped workers of the warm pool which were not used for longer than the idle TTL
+
+        Args:
+            ttl_hours (float): idle time in hours after which a pooled worker is terminated
+
+        Returns:
+            list: of terminated instance ids
+        """
+
+        expired = [worker for worker in self.get_pool()
+            if worker['state'] == 'stopped' and time.time() - worker['last_used'] > ttl_hours * 3600]
+        return self.drain_pool(expired)
+
+    def drain_pool(self, workers):
+        """Terminate pooled workers and cancel their persistent spot requests
+
+        Args:
+            workers (list): of pooled workers as returned by get_pool()
+
+        Returns:
+            list: of terminated instance ids
+        """
+
+        try:
+            if not workers:
+                return []
+            client = self.client('ec2')
+
+            # Cancel the spot requests first so AWS does not launch the workers again
+            request_ids = [worker['spot_request_id'] for worker in workers if worker['spot_request_id']]
+            if request_ids:
+                client.cancel_spot_instance_requests(SpotInstanceRequestIds = request_ids)
+
+            instance_ids = [worker['instance_id'] for worker in workers]
+            client.terminate_instances(InstanceIds = instance_ids)
+            return instance_ids
+
+        except Exception as e:
+            self.log_error(e)
+            return []
+
+    def refresh_pool(self, workers, image_id, fingerprint):
+        """Replace the root volume of stopped pooled workers with a volume of the snapshot of a run
+
+        Args:
+            workers (list): of stopped pooled workers as returned by get_pool()
+            image_id (str): image_id of a Beekeeper run
+            fingerprint (str): fingerprint of the master instance the image was created from
+
+        Returns:
+            list: of refreshed instance ids
+        """
+
+        try:
+            client = self.client('ec2')
+            snapshot_id = self.get_snapshot(image_id)['snapshot_id']
+
+            # Create all new volumes at once and only then swap them so the workers are refreshed side by side
+            volumes = {}
+            for worker in workers:
+                volume = client.create_volume(
+                    SnapshotId = snapshot_id,
+                    AvailabilityZone = worker['availability_zone'],
+                    VolumeType = 'gp2'
+                )
+                volumes[worker['instance_id']] = volume['VolumeId']
+            client.get_waiter('volume_available').wait(VolumeIds = volumes.values())
+
+            for worker in workers:
+                client.detach_volume(VolumeId = worker['volume_id'], InstanceId = worker['instance_id'])
+            client.get_waiter('volume_available').wait(VolumeIds = [worker['volume_id'] for worker in workers])
+
+            for worker in workers:
+                client.attach_volume(
+                    VolumeId = volumes[worker['instance_id']],
+                    InstanceId = worker['instance_id'],
+                    Device = worker['root_device']
+                )
+            client.get_waiter('volume_in_use').wait(VolumeIds = volumes.values())
+
+            # Attached volumes are kept when an instance terminates unless told otherwise
+            for worker in workers:
+                client.modify_instance_attribute(
+                    InstanceId = worker['instance_id'],
+                    BlockDeviceMappings = [{'DeviceName': worker['root_device'], 'Ebs': {'DeleteOnTermination': True}}]
+                )
+                client.delete_volume(VolumeId = worker['volume_id'])
+
+            instance_ids = volumes.keys()
+            client.create_tags(
+                Resources = instance_ids,
+                Tags = [{'Key': 'beekeeper_fingerprint', 'Value': fingerprint}])
+            return instance_ids
+
+        except Exception as e:
+            self.log_error(e)
+            return []
+
+    def start_pool(self, workers, image_id, user_data):
+        """Start stopped pooled workers for a run
+
+        Beeworker reads its user data on every boot, so each worker is given the user data of the run while it is
+        stopped.
+
+        Args:
+            workers (list): of stopped pooled workers as returned by get_pool()
+            image_id (str): image_id of a Beekeeper run
+            user_data (dict): user data as returned by get_user_data()
+
+        Returns:
+            list: of started instance ids
+        """
+
+        client = self.client('ec2')
+        started = []
+        for worker in workers:
+            try:
+                client.modify_instance_attribute(
+                    InstanceId = worker['instance_id'],
+                    UserData = {'Value': json.dumps(user_data)}
+                )
+                started.append(worker['instance_id'])
+            except Exception as e:
+                self.log_error(e)
+
+        if started:
+            client.create_tags(
+                Resources = started,
+                Tags = [{'Key': 'beekeeper_run', 'Value': image_id}])
+            client.start_instances(InstanceIds = started)
+        return started
+
+    def park_pool(self, image_id):
+        """Stop the pooled workers of a run so the next run can start them again
+
+        Workers requested to join the pool by the run are tagged as pooled workers here.
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+
+        Returns:
+            list: of stopped instance ids
+        """
+
+        try:
+            client = self.client('ec2')
+            response = client.describe_instances(
+                Filters = [
+                    {'Name': 'tag:beekeeper_pool', 'Values': [self.aws_instance_id]},
+                    {'Name': 'tag:beekeeper_run', 'Values': [image_id]},
+                    {'Name': 'instance-state-name', 'Values': ['pending', 'running']},
+                ]
+            )
+            instance_ids = [instance['InstanceId'] for reservation in response['Reservations']
+                for instance in reservation['Instances']]
+
+            # Workers joining the pool carry the fingerprint of the run on their persistent spot request
+            response = client.describe_spot_instance_requests(
+                Filters = [
+                    {'Name': 'launch.image-id', 'Values': [image_id]},
+                    {'Name': 'type', 'Values': ['persistent']},
+                    {'Name': 'state', 'Values': ['active']},
+                ]
+            )
+            for request in response['SpotInstanceRequests']:
+                if not request.get('InstanceId'):
+                    continue
+                client.create_tags(
+                    Resources = [request['InstanceId']],
+                    Tags = [
+                        {'Key': 'beekeeper_pool', 'Value': self.aws_instance_id},
+                        {'Key': 'beekeeper_fingerprint',
+                            'Value': self.get_tag_value(request.get('Tags', []), 'beekeeper_fingerprint') or ''},
+                    ])
+                instance_ids.append(request['InstanceId'])
+
+            if instance_ids:
+                client.create_tags(
+                    Resources = instance_ids,
+                    Tags = [{'Key': 'beekeeper_last_used', 'Value': str(int(time.time()))}])
+                client.stop_instances(InstanceIds = instance_ids)
+                click.echo('Stopped %d workers in the warm pool' % len(instance_ids))
+            return instance_ids
+
+        except Exception as e:
+            self.log_error(e)
+            return []
+
+    def get_worker_instance_type(self):
+        """Get the instance type of the workers
+
+        Returns:
+            str: worker_instance_type if set or else the instance type of the master instance
+        """
+        return self.worker_instance_type or self.get_instance()['instance_type']
+
+    def get_spot_instance_price(self, instance_type=None, region=None):
+        """Get the current spot instance price
+
+        Args:
+            instance_type (str): instance type to price. Default to the instance type of the workers
+            region (str): region to price. Default to the region of the profile
+
+        Returns:
+            dict: instance type and its lowest current spot price per hour
+        """
+
+        try:
+            client = self.client('ec2', region)
+            instance_type = instance_type or self.get_worker_instance_type()
+
+            # Spot prices are looked up once per run
+            key = ('spot_price', instance_type, region or self.aws_region)
+            if key in self.cache:
+                return self.from_cache(key)
 
             product_description = 'Linux/UNIX (Amazon VPC)'
 
             response = client.describe_spot_price_history(
                 StartTime = datetime.datetime.utcnow(),
                 EndTime = datetime.datetime.utcnow(),
-                InstanceTypes = [instance['instance_type']],
+                InstanceTypes = [instance_type],
                 Filters=[
                     {'Name': 'product-description', 'Values': [product_description]},
                 ]
@@ -328,10 +1200,11 @@ class AWS(beekeeper.Beekeeper):
                     lowest_price = float(price['SpotPrice'])
 
             result = {
-                'instance_type': instance['instance_type'],
+                'instance_type': instance_type,
                 'price': float(lowest_price)
             }
 
+            self.cache[key] = result
             return result
 
         except Exception as e:
@@ -339,26 +1212,59 @@ class AWS(beekeeper.Beekeeper):
 
     def get_volume(self):
         """Get volume info"""
+        if 'volume' in self.cache:
+            return self.from_cache('volume')
+
         try:
-            client = self.boto3.client('ec2')
+            client = self.client('ec2')
             response = client.describe_volumes(
                 Filters=[
                     {'Name': 'attachment.instance-id', 'Values': [self.aws_instance_id] },
                 ],
             )
+            self.cache['volume'] = response
             return response
 
         except Exception as e:
             self.log_error(e)
 
+    def get_result_transport(self):
+        """Get the format in which Beeworker uploads results
+
+        Returns:
+            dict: compression (none, gzip or zstd) and the interval in seconds at which a worker bundles its results
+                  into one archive. An interval of 0 uploads every result as soon as it is ready
+        """
+
+        compression = transport.resolve_compression(self.result_compression)
+        if compression != self.result_compression.lower():
+            click.echo('The zstandard package is not installed. Results will be compressed with gzip instead.')
+
+        return {
+            'compression': compression,
+            'bundle_seconds': int(self.result_bundle_seconds)
+        }
+
     def download_results(self, image_id):
-        """Monitor the progress of a test and download results as they become ready"""
+        """Monitor the progress of a test and download results as they become ready
+
+        Results are streamed from S3 and decompressed or unpacked into one .result file per feature file, whichever
+        format Beeworker uploaded them in.
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+
+        Returns:
+            list: of the names of the downloaded result files i.e. login.feature.result
+        """
 
         # Instantiate an S3 client and define some variables
-        client = self.boto3.client('s3')
+        client = self.client('s3')
         bucket_name = 'beekeeper-' + image_id
         result_folder = self.behat_result_folder + '/' + image_id
         downloaded_files = []
+        downloaded_keys = []
+        first_results = {}
 
         # Check S3 bucket for result files.
         response = client.list_objects(
@@ -370,20 +1276,125 @@ class AWS(beekeeper.Beekeeper):
             contents = response['Contents']
             for content in contents:
                 filename = content['Key']
-                destination = result_folder + '/' + filename
-                client.download_file(bucket_name, filename, destination)
-                response = client.delete_object(
-                    Bucket=bucket_name,
-                    Key=filename,
-                )
-                downloaded_files.append(filename)
+
+                # Skip the in-flight task markers of the workers
+                if filename.startswith('inflight/'):
+                    continue
+
+                response = client.get_object(Bucket = bucket_name, Key = filename)
+                body = response['Body']
+                if filename.startswith(transport.bundle_prefix):
+                    result_files = transport.unpack_bundle(body, filename, result_folder)
+                    instance_id = transport.get_bundle_worker(filename)
+                else:
+                    result_files = transport.write_result(body, filename, result_folder)
+                    instance_id = response.get('Metadata', {}).get('instance-id')
+                downloaded_keys.append(filename)
+
+                # Keep the earliest upload of each worker to measure its boot latency
+                if instance_id:
+                    uploaded = calendar.timegm(content['LastModified'].utctimetuple())
+                    first_results[instance_id] = min(uploaded, first_results.get(instance_id, uploaded))
+
+                # A late result for a task that was already dead-lettered replaces the dead letter
+                for result_file in result_files:
+                    dead_letter = result_folder + '/' + result_file.split('.result')[0] + '.dead'
+                    if os.path.isfile(dead_letter):
+                        os.remove(dead_letter)
+                    downloaded_files.append(result_file)
+
+        # Delete the downloaded objects with as few requests as possible. delete_objects takes up to 1000 keys
+        for index in range(0, len(downloaded_keys), 1000):
+            client.delete_objects(
+                Bucket = bucket_name,
+                Delete = {
+                    'Objects': [{'Key': key} for key in downloaded_keys[index:index + 1000]],
+                    'Quiet': True
+                }
+            )
+
+        self.record_first_results(image_id, first_results)
         return downloaded_files
 
+    def record_first_results(self, image_id, first_results):
+        """Record the boot latency of the workers of a run whose first result was just downloaded
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            first_results (dict): instance id to the upload time of its earliest result in this download
+        """
+
+        recorded = set([entry['instance_id'] for entry in self.get_boot_latencies(image_id)])
+        pending = [instance_id for instance_id in first_results if instance_id not in recorded]
+        if not pending:
+            return
+
+        try:
+            # The launch time of a worker started from the warm pool is the time it was started
+            for region in self.get_regions(image_id):
+                response = self.client('ec2', region).describe_instances(
+                    Filters = [{'Name': 'instance-id', 'Values': pending}]
+                )
+                for reservation in response['Reservations']:
+                    for instance in reservation['Instances']:
+                        launched = calendar.timegm(instance['LaunchTime'].utctimetuple())
+                        self.record_boot_latency(image_id, instance['InstanceId'], launched,
+                            first_results[instance['InstanceId']])
+
+        except Exception as e:
+            self.log_error(e)
+
+    def download_dead_letters(self, image_id):
+        """Record tasks which exceeded their retry budget and were moved to the dead-letter queue
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+
+        Returns:
+            list: of feature files which were dead-lettered
+        """
+
+        client = self.client('sqs')
+        result_folder = self.behat_result_folder + '/' + image_id
+        dead_letters = []
+
+        # Runs created before dead-letter queues were introduced do not have one
+        try:
+            response = client.get_queue_url(QueueName = "beeworker_dlq_" + image_id)
+            queue_url = response['QueueUrl']
+        except client.exceptions.QueueDoesNotExist:
+            return dead_letters
+
+        # Drain the dead-letter queue and leave a .dead file for each task in the local result folder
+        while True:
+            response = client.receive_message(
+                QueueUrl = queue_url,
+                AttributeNames = ['ApproximateReceiveCount'],
+                MaxNumberOfMessages = 10,
+                WaitTimeSeconds = 0
+            )
+            if 'Messages' not in response:
+                break
+
+            for message in response['Messages']:
+                for feature in message['Body'].splitlines():
+                    if not os.path.isfile(result_folder + '/' + feature + '.result'):
+                        with open(result_folder + '/' + feature + '.dead', 'w') as f:
+                            f.write('Task failed to complete after %s attempts\n'
+                                % message['Attributes']['ApproximateReceiveCount'])
+                        dead_letters.append(feature)
+
+                client.delete_message(
+                    QueueUrl = queue_url,
+                    ReceiptHandle = message['ReceiptHandle']
+                )
+        return dead_letters
+
 
     def initialize_monitoring(self, image_id):
         """Initialize steps for monitor"""
 
-        client = self.boto3.client('s3')
+        client = self.client('s3')
         bucket_name = 'beekeeper-' + image_id
         total_tasks = 0
         completed_tasks = 0
@@ -400,10 +1411,8 @@ class AWS(beekeeper.Beekeeper):
         # Check if local result folder was already created
         result_folder = self.behat_result_folder + '/' + image_id
         if (os.path.isdir(result_folder)):
-            # Result folder already exist. Count the number of result files currently in there
-            listing = glob.glob(result_folder + '/*.result')
-            if listing:
-                completed_tasks = len(listing)
+            # Result folder already exist. Count the number of result and dead-letter files currently in there
+            completed_tasks = self.count_completed_tasks(image_id)
         else:
             # Create the result folder
             os.makedirs(result_folder)
@@ -428,25 +1437,54 @@ class AWS(beekeeper.Beekeeper):
                 click.echo('Cannot find image ID for instance %s.' % self.aws_instance_id)
                 exit()
 
+        # Park the workers of the warm pool before the image they may have been launched from is deleted
+        self.park_pool(image_id)
+
+        # A run spanning several regions has a copy of its image in each of them
+        for region, regional_image_id in sorted(self.get_regions(image_id).items()):
+            self.delete_image(regional_image_id, region)
+        self.delete_run_resources(image_id)
+
+    def delete_image(self, image_id, region=None):
+        """Deregister the AMI image of a run and delete its snapshot
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            region (str): region of the image. Default to the region of the profile
+        """
+
         try:
-            # Current details of the current AMI image
-            image = self.get_snapshot()
+            # Current details of the AMI image
+            image = self.get_snapshot(image_id, region)
             image_id = image['image_id']
             snapshot_id = image['snapshot_id']
-            queue_name = "beeworker_task_" + image_id
-            bucket_name = 'beekeeper-' + image_id
 
             # Deregister AMI
-            client = self.boto3.client('ec2')
+            client = self.client('ec2', region)
             client.deregister_image(ImageId = image_id)
             click.echo("Deregistered AMI Image: %s" % image_id)
 
             # Delete Snapshot
+            self.disable_fast_restore(snapshot_id, region)
             client.delete_snapshot(SnapshotId = snapshot_id)
             click.echo("Deleted Snapshot: %s" % snapshot_id)
 
+        except Exception as e:
+            self.log_error(e)
+
+    def delete_run_resources(self, run_id):
+        """Delete the task queue, dead-letter queue and result bucket of a run
+
+        Args:
+            run_id (str): image_id of a Beekeeper run or the id of a benchmark run
+        """
+
+        queue_name = "beeworker_task_" + run_id
+        bucket_name = 'beekeeper-' + run_id
+        client = self.client('sqs')
+
+        try:
             # Get task queue URL
-            client = self.boto3.client('sqs')
             response = client.get_queue_url(QueueName = queue_name)
             queue_url = response['QueueUrl']
 
@@ -455,14 +1493,44 @@ class AWS(beekeeper.Beekeeper):
                 QueueUrl = queue_url
             )
             click.echo("Deleting task queue: %s" % queue_url)
+        except Exception as e:
+            self.log_error(e)
 
-            # Delete S3 bucket
-            client = self.boto3.client('s3')
+        # Delete the dead-letter queue. Runs created before dead-letter queues were introduced do not have one
+        try:
+            response = client.get_queue_url(QueueName = "beeworker_dlq_" + run_id)
+            dlq_url = response['QueueUrl']
+            response = client.delete_queue(
+                QueueUrl = dlq_url
+            )
+            click.echo("Deleting dead-letter queue: %s" % dlq_url)
+        except client.exceptions.QueueDoesNotExist:
+            pass
+        except Exception as e:
+            self.log_error(e)
+
+        # Delete the priority queue of a run with a critical lane
+        try:
+            priority_url = self.get_priority_queue_url(run_id)
+            if priority_url:
+                client.delete_queue(QueueUrl = priority_url)
+                click.echo("Deleting priority queue: %s" % priority_url)
+        except Exception as e:
+            self.log_error(e)
+
+        try:
+            # Delete S3 bucket after removing what workers left behind i.e. in-flight task markers
+            client = self.client('s3')
+            response = client.list_objects(Bucket = bucket_name)
+            if response.get('Contents'):
+                client.delete_objects(
+                    Bucket = bucket_name,
+                    Delete = {'Objects': [{'Key': content['Key']} for content in response['Contents']], 'Quiet': True}
+                )
             response = client.delete_bucket(
                 Bucket=bucket_name
             )
             click.echo("Deleting S3 bucket: %s" % bucket_name)
-
         except Exception as e:
             self.log_error(e)
 
@@ -477,6 +1545,10 @@ class AWS(beekeeper.Beekeeper):
             float: price of storage per GB-Month
         """
 
+        key = ('storage_price', region, storage_type)
+        if key in self.cache:
+            return self.from_cache(key)
+
         # Assume a higher price for storage if current prices cannot be retrieved
         price = 0.15
 
@@ -491,6 +1563,7 @@ class AWS(beekeeper.Beekeeper):
 
         except Exception as e:
             # Error out quietly if current storage cost cannot be retrieved
-            pass
+            return price
 
+        self.cache[key] = price
         return price
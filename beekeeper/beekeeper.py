@@ -10,15 +10,22 @@ import glob
 import subprocess
 import re
 import operator
+import pipes
+import json
+import hashlib
+import threading
+import gherkin
+import scheduler
+from journal import Journal
+from history import History
 
 class Beekeeper(object):
     """Class to hold global configuration settings and general methods"""
 
     def __init__(self, profile='default'):
         # Read Beekeeper configuration file
-        config_file = os.path.expanduser('~') + '/.beekeeper/config.ini'
         parser = ConfigParser.RawConfigParser()
-        parser.read([config_file])
+        parser.read([self.config_file()])
 
         # Define and set class variables for the default profile first
         default = dict(parser.items('default'))
@@ -40,8 +47,32 @@ class Beekeeper(object):
                 '~/.beekeeper/config.ini file.' % e)
             exit()
 
-        # Define class variable instance which will be used to cache instance data
-        self.instance = None
+        # Optional settings which fall back to a default value when not defined
+        self.max_receive_count = default.get('max_receive_count', '3')
+        self.pack_target = default.get('pack_target', '0')
+        self.result_compression = default.get('result_compression', 'gzip')
+        self.result_bundle_seconds = default.get('result_bundle_seconds', '0')
+        self.slots_per_worker = default.get('slots_per_worker', '1')
+        self.worker_instance_type = default.get('worker_instance_type', '')
+        self.secondary_regions = default.get('secondary_regions', '')
+        self.warm_pool_size = default.get('warm_pool_size', '0')
+        self.warm_pool_ttl = default.get('warm_pool_ttl', '24')
+        self.fingerprint_command = default.get('fingerprint_command', '')
+        self.fast_snapshot_restore = default.get('fast_snapshot_restore', '0')
+        self.prewarm_paths = default.get('prewarm_paths', '')
+        self.max_total_workers = default.get('max_total_workers', '0')
+        self.priority_tags = default.get('priority_tags', 'critical')
+        self.priority_features = default.get('priority_features', '')
+        self.result_cache_ttl = default.get('result_cache_ttl', '0')
+
+        # Define the run cache which holds memoized AWS responses for the life of a run, and count the calls it saved
+        self.cache = {}
+        self.calls_saved = 0
+
+        # The run history database is opened on first use in each thread since SQLite connections cannot be shared
+        # between threads i.e. the setup threads of a multi-profile test. The cost model is calibrated on first use
+        self.histories = threading.local()
+        self.cost_model = None
 
         # Override default values if a profile is given
         if profile in parser.sections():
@@ -51,6 +82,36 @@ class Beekeeper(object):
         elif profile and profile not in parser.sections():
             click.echo('Profile "%s" not found. Using default profile.' % profile)
 
+    def config_file(self):
+        """Get the path of the Beekeeper configuration file"""
+        return os.path.expanduser('~') + '/.beekeeper/config.ini'
+
+    def save_setting(self, key, value):
+        """Save a setting into the section of the current profile in the Beekeeper configuration file
+
+        Args:
+            key (str): name of the setting i.e. slots_per_worker
+            value (str): value of the setting
+        """
+
+        parser = ConfigParser.RawConfigParser()
+        parser.read([self.config_file()])
+        parser.set(self.profile, key, str(value))
+        with open(self.config_file(), 'w') as f:
+            parser.write(f)
+        setattr(self, key, str(value))
+
+    def list_profiles(self):
+        """Get the names of all profiles in the Beekeeper configuration file
+
+        Returns:
+            list: of profile names starting with default
+        """
+
+        parser = ConfigParser.RawConfigParser()
+        parser.read([self.config_file()])
+        return ['default'] + [section for section in parser.sections() if section != 'default']
+
     def get_ssh_connection(self):
         """Get a ssh connection to make remote ssh calls
 
@@ -74,6 +135,153 @@ class Beekeeper(object):
                 'configured properly.' % self.ssh_config_host)
             exit()
 
+    def find_remote_files(self, ssh, folder, pattern):
+        """Find files on the master instance
+
+        Args:
+            ssh (object): ssh connection to the master instance
+            folder (str): folder to search recursively
+            pattern (str): file name pattern i.e. *.feature
+
+        Returns:
+            list: of full paths
+        """
+
+        command = "find %s -type f -name %s" % (pipes.quote(folder), pipes.quote(pattern))
+        stdin, stdout, stderr = ssh.exec_command(command)
+        return stdout.read().splitlines()
+
+    def read_remote_files(self, ssh, paths):
+        """Read the content of several files on the master instance using a single ssh call
+
+        Args:
+            ssh (object): ssh connection to the master instance
+            paths (list): full paths of the files to read
+
+        Returns:
+            dict: full path to file content. Files which cannot be read are left out
+        """
+
+        contents = {}
+        if not paths:
+            return contents
+
+        # tail -v prints a "==> path <==" header before the content of each file
+        command = "tail -v -n +1 -- %s" % ' '.join([pipes.quote(path) for path in paths])
+        stdin, stdout, stderr = ssh.exec_command(command)
+
+        wanted = set(paths)
+        path = None
+        for line in stdout.read().splitlines(True):
+            header = re.match(r'^==> (.*) <==$', line.rstrip('\n'))
+            if header and header.group(1) in wanted:
+                path = header.group(1)
+                contents[path] = ''
+            elif path:
+                contents[path] += line
+        return contents
+
+    def read_remote_revisions(self, ssh, git_ref, paths):
+        """Read the content several files had at a git reference on the master instance using a single ssh call
+
+        Args:
+            ssh (object): ssh connection to the master instance
+            git_ref (str): git reference i.e. branch, tag or commit
+            paths (list): full paths of the files in the master instance's git repository
+
+        Returns:
+            dict: full path to file content at the git reference. Files which did not exist then are left out
+        """
+
+        contents = {}
+        if not paths:
+            return contents
+
+        # Print a "==> path <==" header like tail -v before the content of each file. git show resolves ./path relative
+        # to the folder it runs in, so the paths do not need to be made relative to the top level folder
+        command = 'for path in %s; do (cd "$(dirname "$path")" && object=%s:./"$(basename "$path")" && ' \
+            'git cat-file -e "$object" && echo "==> $path <==" && git show "$object") 2>/dev/null; done' \
+            % (' '.join([pipes.quote(path) for path in paths]), pipes.quote(git_ref))
+        stdin, stdout, stderr = ssh.exec_command(command)
+
+        wanted = set(paths)
+        path = None
+        for line in stdout.read().splitlines(True):
+            header = re.match(r'^==> (.*) <==$', line.rstrip('\n'))
+            if header and header.group(1) in wanted:
+                path = header.group(1)
+                contents[path] = ''
+            elif path:
+                contents[path] += line
+        return contents
+
+    def get_changed_files(self, ssh, git_ref):
+        """Get the files changed in the master instance's git repository since a git reference
+
+        Args:
+            ssh (object): ssh connection to the master instance
+            git_ref (str): git reference i.e. branch, tag or commit
+
+        Returns:
+            list: full paths of changed and untracked files or None if the git command failed
+        """
+
+        command = "cd %s && git rev-parse --show-toplevel && git diff --name-only %s -- && " \
+            "git ls-files --others --exclude-standard --full-name" \
+            % (pipes.quote(self.behat_project_folder), pipes.quote(git_ref))
+        stdin, stdout, stderr = ssh.exec_command(command)
+        lines = stdout.read().splitlines()
+
+        if stdout.channel.recv_exit_status() != 0 or not lines:
+            return None
+
+        # git lists paths relative to the top level folder of the repository
+        toplevel = lines[0]
+        return [toplevel + '/' + path for path in lines[1:] if path]
+
+    def get_master_fingerprint(self, ssh):
+        """Fingerprint the state of the master instance which ends up in its snapshot
+
+        The fingerprint hashes the output of fingerprint_command or, if it is not set, the current commit of the git
+        repository holding the Behat project, the diff of its uncommitted changes and a checksum of each untracked file.
+        A further edit to a file which already had uncommitted changes therefore changes the fingerprint as well.
+
+        Args:
+            ssh (object): ssh connection to the master instance
+
+        Returns:
+            str: fingerprint or None if the command failed
+        """
+
+        command = self.fingerprint_command or 'cd %s && cd "$(git rev-parse --show-toplevel)" && git rev-parse HEAD && ' \
+            'git diff --binary HEAD && git ls-files -z --others --exclude-standard | xargs -0 -r sha1sum' \
+            % pipes.quote(self.behat_project_folder)
+        stdin, stdout, stderr = ssh.exec_command(command)
+        output = stdout.read()
+
+        if stdout.channel.recv_exit_status() != 0 or not output:
+            return None
+        return hashlib.sha1(output).hexdigest()[:16]
+
+    def get_master_revision(self, ssh):
+        """Get the commit checked out in the master instance's git repository if it has no uncommitted changes
+
+        Args:
+            ssh (object): ssh connection to the master instance
+
+        Returns:
+            str: commit hash or None if the repository has uncommitted changes or the git command failed
+        """
+
+        command = 'cd %s && test -z "$(git status --porcelain)" && git rev-parse HEAD' \
+            % pipes.quote(self.behat_project_folder)
+        stdin, stdout, stderr = ssh.exec_command(command)
+        output = stdout.read().strip()
+
+        if stdout.channel.recv_exit_status() != 0 or not output:
+            return None
+        return output
+
     def timestamp(self, format = "%Y-%m-%d %H:%M:%S UTC", utc = True):
         """Get the current time
 
@@ -159,7 +367,11 @@ class Beekeeper(object):
         results_path = '%s/%s/*.result' % (self.behat_result_folder, image_id)
         listing = glob.glob(results_path)
 
-        if not listing:
+        # Get a list of tasks which were dead-lettered after exceeding their retry budget
+        dead_letters = glob.glob('%s/%s/*.dead' % (self.behat_result_folder, image_id))
+
+        if not listing and not dead_letters:
+            self.record_history(image_id, None)
             return None
 
         # Summarize each result file into a detail line
@@ -176,49 +388,505 @@ class Beekeeper(object):
             basename = os.path.basename(full_path)
             feature_name = basename.split('.feature.result')[0]
 
-            # Setup nested dictionary
-            details[feature_name] = {
-                'scenarios': {},
-                'steps': {}
-            }
-
-            # Get the last 3 lines from the result file which contains the summary we need
-            tail = subprocess.Popen(['tail', '-n', '3', full_path], stdout=subprocess.PIPE)
-            for line in tail.stdout:
-                for stats_type in {'scenarios', 'steps'}:
-                    stats_regex = '\d+(?=\s%s?)' % stats_type
-                    stats_matched = re.search(stats_regex, line)
-                    if stats_matched:
-                        details[feature_name][stats_type]['total'] = int(stats_matched.group(0))
-                        totals[stats_type]['total'] += int(stats_matched.group(0))
-                        for result_type in {'passed', 'failed', 'skipped'}:
-                            result_regex = '\d+(?=\s%s)' % result_type
-                            matched = re.search(result_regex, line)
-                            if matched:
-                                details[feature_name][stats_type][result_type] = int(matched.group(0))
-                                totals[stats_type][result_type] += int(matched.group(0))
-                            else:
-                                details[feature_name][stats_type][result_type] = 0
+            details[feature_name] = self.parse_result_file(full_path)
+            for stats_type in totals:
+                for result_type in totals[stats_type]:
+                    totals[stats_type][result_type] += details[feature_name][stats_type][result_type]
         sorted_details = sorted(details.items(), key=operator.itemgetter(0))
         results = {
             'details': sorted_details,
-            'totals': totals
+            'totals': totals,
+            'dead_letters': sorted([os.path.basename(path).split('.feature.dead')[0] for path in dead_letters]),
+            'cached': sorted([name.split('.feature')[0] for name in self.get_cached_features(image_id)]),
+            'interruptions': len(self.get_interruptions(image_id)),
+            'capacity_moves': len(self.get_interruptions(image_id, 'capacity_move'))
         }
+        self.record_history(image_id, results)
         return results
 
-    def available_reports(self):
-        """Get a list of available reports"""
-        listing = glob.glob(self.behat_result_folder + '/*')
+    def get_history(self):
+        """Get the database indexing the results of all runs in the result folder
+
+        Returns:
+            object: history.History
+        """
+
+        history = getattr(self.histories, 'history', None)
+        if history is None:
+            if not os.path.isdir(self.behat_result_folder):
+                os.makedirs(self.behat_result_folder)
+            history = self.histories.history = History(self.behat_result_folder)
+        return history
+
+    def record_history(self, image_id, results):
+        """Record the results of a run in the run history
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            results (dict): results as returned by summarize_results() or None if there are none yet
+        """
+
+        result_folder = '%s/%s' % (self.behat_result_folder, image_id)
+        created = os.path.getctime(result_folder) if os.path.isdir(result_folder) else time.time()
+        self.get_history().record_run(image_id, self.profile, created, results)
+        self.get_history().record_analysis(image_id, self.load_analysis(image_id))
+        self.cost_model = None
+        if results:
+            self.cache_passes(image_id, created, results)
+
+    def cache_passes(self, image_id, created, results):
+        """Add the feature files which passed in a run to the result cache
+
+        Feature files whose result was itself copied from the cache are left out so the cache entry keeps pointing at
+        the run which actually tested them.
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            created (float): creation time of the run as a timestamp
+            results (dict): results as returned by summarize_results()
+        """
+
+        state = Journal(self.behat_result_folder, image_id).get_state()
+        if not float(self.result_cache_ttl) or not state.get('fingerprint'):
+            return
+
+        analysis = self.load_analysis(image_id)
+        cached = self.get_cached_features(image_id)
+        passes = []
+        for feature_name, result in results['details']:
+            name = feature_name + '.feature'
+            if name in cached or 'hash' not in analysis.get(name, {}):
+                continue
+            if result['scenarios']['failed'] or result['steps']['failed'] or not result['scenarios']['passed']:
+                continue
+            with open('%s/%s/%s.result' % (self.behat_result_folder, image_id, name), 'rb') as f:
+                passes.append((name, analysis[name]['hash'], f.read()))
+
+        if passes:
+            self.get_history().record_passes(image_id, created, state['fingerprint'], state.get('revision'), passes)
+
+    def restore_cached_results(self, image_id, cached):
+        """Copy cached results into the result folder of a run instead of running their feature files again
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            cached (dict): feature name to the image_id of the run it passed in
+        """
+
+        result_folder = '%s/%s' % (self.behat_result_folder, image_id)
+        if not os.path.isdir(result_folder):
+            os.makedirs(result_folder)
+
+        history = self.get_history()
+        for feature, source_image_id in cached.items():
+            with open('%s/%s.result' % (result_folder, feature), 'wb') as f:
+                f.write(history.get_cached_result(feature, source_image_id))
+        with open(result_folder + '/cached.json', 'w') as f:
+            json.dump(cached, f)
+
+    def get_cached_features(self, image_id):
+        """Get the feature files of a run whose result was copied from the result cache
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+
+        Returns:
+            dict: feature name to the image_id of the run it passed in. Empty if nothing came from the cache
+        """
+
+        path = '%s/%s/cached.json' % (self.behat_result_folder, image_id)
+        if not os.path.isfile(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def index_runs(self):
+        """Record the runs in the result folder which are not in the run history yet i.e. runs from before it existed"""
+
+        if not os.path.isdir(self.behat_result_folder):
+            return
+
+        history = self.get_history()
+        indexed = set([image_id for image_id, created in history.get_runs()])
+        analyzed = history.get_analyzed_runs()
+        for image_id in os.listdir(self.behat_result_folder):
+            if image_id.startswith('.'):
+                continue
+
+            # Runs indexed before the history kept the static analysis of their feature files only need that
+            result_folder = self.behat_result_folder + '/' + image_id
+            if image_id in indexed:
+                if image_id not in analyzed and os.path.isfile(result_folder + '/analysis.json'):
+                    history.record_analysis(image_id, self.load_analysis(image_id))
+                continue
+
+            # Benchmark runs are recorded separately so they never skew the durations of test runs
+            if os.path.isdir(result_folder) and not os.path.isfile(result_folder + '/benchmark.json'):
+                self.summarize_results(image_id)
+
+    def parse_result_file(self, full_path):
+        """Parse the summary at the end of a Behat result file
+
+        Args:
+            full_path (str): path of a result file
+
+        Returns:
+            dict: scenario and step counts plus the duration in seconds (None if not found)
+        """
+
+        result = {
+            'scenarios': {'total': 0, 'passed': 0, 'failed': 0},
+            'steps': {'total': 0, 'passed': 0, 'failed': 0, 'skipped': 0},
+            'duration': None
+        }
+
+        # Get the last 3 lines from the result file which contains the summary we need
+        tail = subprocess.Popen(['tail', '-n', '3', full_path], stdout=subprocess.PIPE)
+        for line in tail.stdout:
+            for stats_type in {'scenarios', 'steps'}:
+                stats_regex = '\d+(?=\s%s?)' % stats_type
+                stats_matched = re.search(stats_regex, line)
+                if stats_matched:
+                    result[stats_type]['total'] = int(stats_matched.group(0))
+                    for result_type in ['passed', 'failed', 'skipped']:
+                        if result_type not in result[stats_type]:
+                            continue
+                        result_regex = '\d+(?=\s%s)' % result_type
+                        matched = re.search(result_regex, line)
+                        if matched:
+                            result[stats_type][result_type] = int(matched.group(0))
+
+            # Behat ends its output with the elapsed time i.e. 1m02.35s (45.12Mb)
+            duration_matched = re.match('^(\d+)m([\d.]+)s', line)
+            if duration_matched:
+                result['duration'] = int(duration_matched.group(1)) * 60 + float(duration_matched.group(2))
+        tail.wait()
+        return result
+
+    def count_completed_tasks(self, image_id):
+        """Count the feature files of a run which finished i.e. have a result or were dead-lettered
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+
+        Returns:
+            int: number of finished feature files
+        """
+        return len(self.get_finished_features(image_id))
+
+    def get_finished_features(self, image_id):
+        """Get the feature files of a run which have a result or were dead-lettered
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+
+        Returns:
+            set: of feature file names i.e. login.feature
+        """
 
-        if not listing:
+        result_folder = '%s/%s' % (self.behat_result_folder, image_id)
+        paths = glob.glob(result_folder + '/*.result') + glob.glob(result_folder + '/*.dead')
+        return set([os.path.splitext(os.path.basename(path))[0] for path in paths])
+
+    def get_priority_verdict(self, image_id, features):
+        """Get the verdict of the critical lane of a run once all of its feature files are finished
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            features (set): names of the feature files in the critical lane i.e. checkout.feature
+
+        Returns:
+            list: names of the failed or dead-lettered feature files, empty if all passed, or None while some are still
+                  running
+        """
+
+        if not features.issubset(self.get_finished_features(image_id)):
             return None
 
-        # Sort the list by most recent
-        results = {}
-        for full_path in listing:
-            basename = os.path.basename(full_path)
-            results[basename] = os.path.getctime(full_path)
+        failed = []
+        for feature in sorted(features):
+            path = '%s/%s/%s.result' % (self.behat_result_folder, image_id, feature)
+            if not os.path.isfile(path) or self.parse_result_file(path)['scenarios']['failed']:
+                failed.append(feature)
+        return failed
+
+    def record_interruption(self, image_id, request, replacement_id, event='interruption', region=None):
+        """Append an interrupted worker to the interruption log of a run
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            request (dict): spot request of the interrupted worker
+            replacement_id (str): id of the replacement spot request
+            event (str): interruption, or capacity_move for a spot request moved to another region for lack of capacity
+            region (str): region of the replacement spot request of a capacity move
+
+        Returns:
+            dict: the recorded interruption
+        """
+
+        interruption = {
+            'time': self.timestamp(),
+            'event': event,
+            'request_id': request['SpotInstanceRequestId'],
+            'instance_id': request.get('InstanceId'),
+            'status': request['Status']['Code'],
+            'replacement_id': replacement_id,
+            'region': region
+        }
+        with open('%s/%s/interruptions.log' % (self.behat_result_folder, image_id), 'a') as f:
+            f.write(json.dumps(interruption) + '\n')
+        return interruption
+
+    def get_interruptions(self, image_id, event='interruption'):
+        """Get the workers of a run which were interrupted
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            event (str): interruption or capacity_move. None gets both
+
+        Returns:
+            list: of interruptions as recorded by record_interruption()
+        """
+
+        path = '%s/%s/interruptions.log' % (self.behat_result_folder, image_id)
+        if not os.path.isfile(path):
+            return []
+
+        # Entries recorded before capacity moves were told apart are all interruptions
+        with open(path) as f:
+            interruptions = [json.loads(line) for line in f if line.strip()]
+        return [interruption for interruption in interruptions
+            if event is None or interruption.get('event', 'interruption') == event]
+
+    def record_boot_latency(self, image_id, instance_id, launched, first_result):
+        """Append the time a worker took from its launch to its first result to the boot log of a run
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            instance_id (str): instance id of the worker
+            launched (float): launch time of the worker as a timestamp
+            first_result (float): upload time of the first result of the worker as a timestamp
+        """
+
+        entry = {
+            'instance_id': instance_id,
+            'launched': launched,
+            'first_result': first_result,
+            'latency': first_result - launched
+        }
+        with open('%s/%s/boot.log' % (self.behat_result_folder, image_id), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def get_boot_latencies(self, image_id):
+        """Get the time each worker of a run took from its launch to its first result
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+
+        Returns:
+            list: of entries as recorded by record_boot_latency()
+        """
+
+        path = '%s/%s/boot.log' % (self.behat_result_folder, image_id)
+        if not os.path.isfile(path):
+            return []
+
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def save_regions(self, image_id, regions):
+        """Save the regions of a run and the copy of its AMI image in each of them
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            regions (dict): region to the image id of the run in that region
+        """
+
+        result_folder = '%s/%s' % (self.behat_result_folder, image_id)
+        if not os.path.isdir(result_folder):
+            os.makedirs(result_folder)
+        with open(result_folder + '/regions.json', 'w') as f:
+            json.dump(regions, f)
+
+    def get_regions(self, image_id):
+        """Get the regions of a run and the copy of its AMI image in each of them
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+
+        Returns:
+            dict: region to image id. Runs in a single region only have the region of the profile
+        """
+
+        path = '%s/%s/regions.json' % (self.behat_result_folder, image_id)
+        if not os.path.isfile(path):
+            return {self.aws_region: image_id}
+        with open(path) as f:
+            return json.load(f)
+
+    def analyze_features(self, ssh):
+        """Statically analyze every feature file on the master instance
+
+        Args:
+            ssh (object): ssh connection to the master instance
+
+        Returns:
+            dict: feature file name to its analysis as returned by gherkin.analyze_feature()
+        """
+
+        sources = self.read_remote_files(ssh, self.find_remote_files(ssh, self.behat_project_folder, '*.feature'))
 
-        sorted_results = sorted(results.items(), key=operator.itemgetter(1), reverse=True)
+        analysis = {}
+        for path, text in sources.items():
+            analysis[os.path.basename(path)] = gherkin.analyze_feature(text)
+
+            # The content hash tells the result cache whether a feature file changed since it passed
+            analysis[os.path.basename(path)]['hash'] = hashlib.sha1(text).hexdigest()
+        return analysis
+
+    def select_priority_features(self, features, analysis):
+        """Select the feature files of the critical lane, which run before all others
+
+        Args:
+            features (list): names of feature files i.e. login.feature
+            analysis (dict): feature name to its analysis as returned by gherkin.analyze_feature()
+
+        Returns:
+            set: names of the feature files tagged with one of priority_tags or listed in priority_features
+        """
+
+        tags = set([tag.strip().lstrip('@') for tag in self.priority_tags.split(',') if tag.strip()])
+        listed = set([name.strip() for name in self.priority_features.split(',') if name.strip()])
+
+        selected = set()
+        for feature in features:
+            if feature in listed or tags.intersection(analysis.get(feature, {}).get('tags', [])):
+                selected.add(feature)
+        return selected
+
+    def save_analysis(self, image_id, analysis):
+        """Save the static analysis of the feature files of a run so it can calibrate the cost model later
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            analysis (dict): feature file name to its analysis
+        """
+
+        result_folder = '%s/%s' % (self.behat_result_folder, image_id)
+        if not os.path.isdir(result_folder):
+            os.makedirs(result_folder)
+        with open(result_folder + '/analysis.json', 'w') as f:
+            json.dump(analysis, f)
+
+    def load_analysis(self, image_id):
+        """Load the static analysis of the feature files of a run
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+
+        Returns:
+            dict: feature file name to its analysis. Empty if the run has no analysis
+        """
+
+        path = '%s/%s/analysis.json' % (self.behat_result_folder, image_id)
+        if not os.path.isfile(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def get_cost_model(self):
+        """Get the cost model calibrated against the measured durations of all previous runs
+
+        Returns:
+            object: scheduler.CostModel
+        """
+
+        if self.cost_model is None:
+            self.index_runs()
+            self.cost_model = scheduler.CostModel.calibrate(self.get_history().get_calibration_samples())
+        return self.cost_model
+
+    def get_latest_analysis(self):
+        """Get the static analysis of the feature files saved with the most recent run
+
+        Returns:
+            dict: feature file name to its analysis. Empty if no run has an analysis
+        """
+
+        self.index_runs()
+        return self.get_history().get_latest_analysis()
+
+    def estimate_feature_durations(self, features, analysis):
+        """Estimate the duration of each feature file from its last run or else from the calibrated cost model
+
+        Args:
+            features (list): names of feature files
+            analysis (dict): feature file name to its static analysis
+
+        Returns:
+            dict: feature file name to estimated duration in seconds
+        """
+
+        return scheduler.estimate_durations(features, self.get_feature_durations(), analysis, self.get_cost_model())
+
+    def get_slot_speedup(self, instance_type, slots):
+        """Get the throughput of a worker with several slots relative to a worker with one slot
+
+        Args:
+            instance_type (str): instance type of the workers
+            slots (int): number of Behat processes per worker
+
+        Returns:
+            float: the speedup measured by benchmark-slots or, if it was never measured, the number of slots
+        """
+
+        if slots <= 1:
+            return 1.0
+        speedup = self.get_history().get_speedup(instance_type, slots)
+        return speedup if speedup else float(slots)
+
+    def get_startup_times(self):
+        """Get the fixed startup times measured in the journals of previous runs
+
+        Returns:
+            dict: median seconds to snapshot the master instance, fulfill the spot requests and boot the workers until
+                  the first result, plus the number of runs measured. Defaults are used when nothing was measured
+        """
+
+        measured = {'snapshot': [], 'fulfillment': [], 'boot': []}
+        phases = {
+            'snapshot': ('snapshot_created', 'snapshot_available'),
+            'fulfillment': ('result_bucket_created', 'workers_requested'),
+            'boot': ('workers_requested', 'first_result')
+        }
+        for image_id, created in self.available_reports() or []:
+            times = Journal(self.behat_result_folder, image_id).get_times()
+            for phase, (start, end) in phases.items():
+                if start in times and end in times:
+                    measured[phase].append((times[end] - times[start]).total_seconds())
+
+        startup = {'runs': max([len(values) for values in measured.values()])}
+        for phase, values in measured.items():
+            startup[phase] = sorted(values)[len(values) // 2] if values else scheduler.default_startup_seconds[phase]
+        return startup
+
+    def get_feature_durations(self):
+        """Get the duration of each feature file from its most recent result in previous runs
+
+        Returns:
+            dict: feature file name to duration in seconds
+        """
+
+        self.index_runs()
+        durations = self.get_history().get_durations()
+        return dict([(feature + '.feature', duration) for feature, duration in durations.items()])
+
+    def available_reports(self):
+        """Get a list of available reports from the run history
+
+        Returns:
+            list: of (image_id, created) tuples, most recent first, or None if there are no runs
+        """
 
-        return sorted_results
\ No newline at end of file
+        self.index_runs()
+        return self.get_history().get_runs() or None
\ No newline at end of file
@@ -1,9 +1,22 @@
 from __future__ import print_function
 import aws
+import impact
+import scheduler
+import pipeline
+import transport
+import beekeeper
+from journal import Journal
 import click
 import time
+import datetime
 import sys
+import os
+import math
+import glob
 import re
+import json
+import threading
+import arrow
 
 # Define a list of existing AWS regions
 # TODO: find a way to update this list automatically
@@ -16,6 +29,34 @@ aws_regions = [
 def cli():
     """Beekeeper is a command line interface for running parallel Behat tests on Amazon Web Services"""
 
+
+def get_service(ctx, profile='default'):
+    """Get the AWS object of a profile which is shared by every command invoked within the same run
+
+    The configuration file is read and the boto3 session created only once per profile. Instance, volume and price
+    lookups are memoized in the run cache of the object.
+
+    Args:
+        ctx (object): click context
+        profile (str): Beekeeper profile
+
+    Returns:
+        object: aws.AWS object
+    """
+
+    services = ctx.meta.setdefault('beekeeper.services', {})
+    if profile not in services:
+        service = aws.AWS(profile)
+
+        # Profiles with the same AWS credentials share their clients for each region
+        for other in services.values():
+            if (other.aws_access_key_id, other.aws_secret_access_key) == \
+                    (service.aws_access_key_id, service.aws_secret_access_key):
+                service.share_clients(other)
+                break
+        services[profile] = service
+    return services[profile]
+
 @cli.command()
 @click.argument('region', required=False, type=click.Choice(aws_regions))
 def list(region):
@@ -89,15 +130,44 @@ def status(profile):
         click.echo(fmt.format('Messages in task queue', 'Not Available'))
         click.echo()
 
+    # Display the warm pool. Stopped workers only cost the storage of their volume
+    pool = service.get_pool()
+    if pool:
+        stopped = [worker for worker in pool if worker['state'] == 'stopped']
+        storage = sum([worker['volume_size'] for worker in stopped])
+        daily_cost = storage * service.get_storage_price(service.aws_region) / 31
+        click.echo(fmt.format('Warm Pool Workers', '%d (%d stopped)' % (len(pool), len(stopped))))
+        click.echo(fmt.format('Oldest Idle Worker', arrow.get(min([worker['last_used'] for worker in pool])).humanize()))
+        click.echo(fmt.format('Idle TTL', '%s hours' % service.warm_pool_ttl))
+        click.echo(fmt.format('Estimated Cost while Stopped', '$%.4f per day' % daily_cost))
+        for worker in pool:
+            click.echo(fmt.format(worker['instance_id'], '%s, used %s, fingerprint %s' % (worker['state'],
+                arrow.get(worker['last_used']).humanize(), worker['fingerprint'] or 'unknown')))
+        click.echo()
+
+
+@cli.command('drain-pool')
+@click.argument('profile', default='default')
+@click.pass_context
+def drain_pool(ctx, profile):
+    """Terminate the stopped workers of the warm pool"""
+    service = get_service(ctx, profile)
+    stopped = [worker for worker in service.get_pool() if worker['state'] == 'stopped']
+    terminated = service.drain_pool(stopped)
+    click.echo('Terminated %d workers of the warm pool' % len(terminated))
+
 
 @cli.command()
 @click.argument('profile', default='default')
-def snapshot(profile):
+@click.option('--fast-restore', default=False, is_flag=True,
+    help='Enable fast snapshot restore in the availability zone of the master instance')
+@click.pass_context
+def snapshot(ctx, profile, fast_restore):
     """Create a snapshot of an instance."""
-    service = aws.AWS(profile)
+    service = get_service(ctx, profile)
     print ('Creating AMI Image...', end="")
     sys.stdout.flush()
-    image = service.create_snapshot()
+    image = service.create_snapshot(fast_restore=fast_restore)
     click.echo('completed. The AMI ID is %s' % image['ImageId'])
     return image['ImageId']
 
@@ -105,13 +175,16 @@ def snapshot(profile):
 @cli.command()
 @click.argument('profile', default='default')
 @click.option('--max_workers', type=int, help='Maximum number of AWS instances to create')
+@click.option('--slots', type=int, help='Number of Behat processes per worker')
 @click.option('--detail', default=False, is_flag=True, help='Show cost estimate in detail')
-def cost(profile, max_workers, detail):
+@click.pass_context
+def cost(ctx, profile, max_workers, slots, detail):
     """Estimate the cost of running a test"""
 
-    service = aws.AWS(profile)
+    service = get_service(ctx, profile)
 
     max_workers = max_workers if max_workers else int(service.max_workers)
+    slots = slots if slots else int(service.slots_per_worker)
 
     # Calculate EC2 cost
     spot_result = service.get_spot_instance_price()
@@ -154,6 +227,36 @@ def cost(profile, max_workers, detail):
         click.echo()
         click.echo(fmt.format('TOTAL ESTIMATED COST', '$%.4f' % total))
         click.echo()
+
+        # Predict the runtime from the durations of previous runs or else a static analysis of the feature files. The
+        # analysis saved with the most recent run saves connecting to the master instance
+        analysis = service.get_latest_analysis()
+        analysis_source = 'saved with the most recent run'
+        if not analysis:
+            analysis = service.analyze_features(service.get_ssh_connection())
+            analysis_source = 'read from the master instance'
+        model = service.get_cost_model()
+        estimates = service.estimate_feature_durations(analysis.keys(), analysis)
+        workload = sum(estimates.values())
+        speedup = service.get_slot_speedup(spot_result['instance_type'], slots)
+        durations = scheduler.slot_durations(sorted(estimates.values(), reverse=True), slots, speedup)
+        makespan = scheduler.simulate_makespan(durations, max_workers * slots)
+        startup = service.get_startup_times()
+        fixed_startup = startup['snapshot'] + startup['fulfillment'] + startup['boot']
+        runtime = fixed_startup + makespan
+        click.echo('Estimated Runtime')
+        click.echo('-----------------')
+        click.echo(fmt.format('Feature Files', '%d (%s)' % (len(analysis), analysis_source)))
+        click.echo(fmt.format('Scenarios', sum([stats['scenarios'] for stats in analysis.values()])))
+        click.echo(fmt.format('Steps', sum([stats['steps'] for stats in analysis.values()])))
+        click.echo(fmt.format('Javascript Scenarios', sum([stats['javascript'] for stats in analysis.values()])))
+        click.echo(fmt.format('Cost Model', 'calibrated from %d results' % model.samples if model.samples
+            else 'default estimates (no previous results)'))
+        click.echo(fmt.format('Sequential Runtime', '%.1f minutes' % (workload / 60)))
+        click.echo(fmt.format('Slots per Worker', '%d (%.1fx the throughput of one slot)' % (slots, speedup)))
+        click.echo(fmt.format('Fixed Startup Time', '%.1f minutes' % (fixed_startup / 60)))
+        click.echo(fmt.format('ESTIMATED RUNTIME', '%.1f minutes with %d workers' % (runtime / 60, max_workers)))
+        click.echo()
     else:
         click.echo('Current Spot Price for %s is $%.4f per hour' % (spot_result['instance_type'], spot_result['price']))
         click.echo('Estimated cost for running %d instances plus storage charge is $%.4f' % (max_workers, total))
@@ -161,23 +264,111 @@ def cost(profile, max_workers, detail):
 
 
 @cli.command()
-@click.argument('profile', default='default')
+@click.argument('profiles', nargs=-1)
 @click.option('--max_workers', type=int, help='Maximum number of AWS instances to create')
 @click.option('--max_bid_price', type=float, help='Maximium bid price for a spot instance')
+@click.option('--changed-since', 'changed_since', metavar='GIT_REF',
+    help='Only run feature files impacted by changes since a git reference on the master instance')
+@click.option('--pack', type=int, metavar='SECONDS',
+    help='Pack small feature files into tasks of up to this many seconds. 0 disables packing')
+@click.option('--fail-fast', 'fail_fast', metavar='N|N%',
+    help='Abort the run once N feature files (or N% of all feature files) have failed')
+@click.option('--slots', type=int, help='Number of Behat processes per worker')
+@click.option('--regions', metavar='REGION[,REGION]',
+    help='Secondary regions to spread the workers over. Default to secondary_regions')
+@click.option('--auto-workers', 'auto_workers', default=False, is_flag=True,
+    help='Use the number of workers recommended by the plan command')
+@click.option('--deadline', type=float, metavar='MINUTES', help='Runtime target for the planner. Implies --auto-workers')
+@click.option('--budget', type=float, metavar='DOLLARS', help='Cost target for the planner. Implies --auto-workers')
+@click.option('--max_total_workers', type=int,
+    help='Maximum number of AWS instances across all profiles. Default to max_total_workers')
+@click.option('--force-full', 'force_full', default=False, is_flag=True,
+    help='Run every feature file, including those which passed before with the same inputs')
 @click.option('--debug', default=False, is_flag=True)
 @click.pass_context
-def test(ctx, profile, max_workers, max_bid_price, debug):
+def test(ctx, profiles, max_workers, max_bid_price, changed_since, pack, fail_fast, slots, regions, auto_workers,
+         deadline, budget, max_total_workers, force_full, debug):
     """Deploy beeworker instances and start testing"""
 
-    service = aws.AWS(profile)
+    options = {
+        'max_workers': max_workers,
+        'max_bid_price': max_bid_price,
+        'changed_since': changed_since,
+        'pack': pack,
+        'fail_fast': fail_fast,
+        'slots': slots,
+        'regions': regions,
+        'auto_workers': auto_workers,
+        'deadline': deadline,
+        'budget': budget,
+        'force_full': force_full,
+        'debug': debug
+    }
+    # Several profiles are tested at once when more than one is given
+    profiles = profiles or ('default',)
+    if len(profiles) > 1:
+        test_profiles(ctx, profiles, options, max_total_workers)
+        return
 
     click.echo('\n--- CHECK ---')
+    run = check_run(ctx, profiles[0], options)
+    confirm_cost(ctx, run)
+    service = run['service']
+
+    click.echo('\n--- SETUP ---')
+    setup_run(run)
+
+    click.echo('\n--- WORK ---')
+    click.echo('%d workers launched and preparing to test' % run['max_workers'])
+
+    # Invoke the monitor command which also summarizes the results as they are downloaded
+    image_id = run['image_id']
+    results = ctx.invoke(monitor, image_id=image_id, profile=run['profile'], fail_fast=run['fail_fast'])
+    run['journal'].record('monitor_finished')
+    run['stop_launching'].set()
+    click.echo('Tests completed at %s. Total elapsed time is %s'
+        % (service.timestamp('%H:%M:%S', False), service.elapsed_time(run['start_time'])))
+
+    # Invoke cleanup command
+    click.echo('\n--- Cleanup ---')
+    ctx.invoke(cleanup, profile=run['profile'], image_id=image_id)
+    run['journal'].record('cleanup_finished')
+
+    # Display the summary of the test results which was built while monitoring
+    click.echo('\n--- REPORT ---')
+    display_results(results, max_receive_count=service.max_receive_count)
+    display_boot_latencies(service.get_boot_latencies(image_id))
+    run['journal'].record('report_finished')
+    click.echo('\n%d AWS calls saved by the run cache' % service.calls_saved)
+
+
+def check_run(ctx, profile, options):
+    """Check that a profile is ready to test and work out the tasks and workers of its run
+
+    Exits if the profile cannot be tested.
+
+    Args:
+        ctx (object): click context
+        profile (str): Beekeeper profile
+        options (dict): options of the test command
+
+    Returns:
+        dict: the run, which confirm_cost(), setup_run() and the monitor take over
+    """
+
+    service = get_service(ctx, profile)
     click.echo('Process started at %s' % service.timestamp('%H:%M:%S', False) )
     start_time = time.time()
 
     # Use default settings if optional values not provided
-    max_workers = max_workers if max_workers else int(service.max_workers)
-    max_bid_price = max_bid_price if max_bid_price else float(service.max_bid_price)
+    max_workers = options['max_workers'] if options['max_workers'] else int(service.max_workers)
+    max_bid_price = options['max_bid_price'] if options['max_bid_price'] else float(service.max_bid_price)
+    pack = options['pack'] if options['pack'] is not None else int(service.pack_target)
+    slots = options['slots'] if options['slots'] else int(service.slots_per_worker)
+    regions = options['regions'] if options['regions'] is not None else service.secondary_regions
+    regions = [region.strip() for region in regions.split(',') if region.strip() and region.strip() != service.aws_region]
+    changed_since = options['changed_since']
+    fail_fast = options['fail_fast']
 
     # Check if the master instance is running.
     instance = service.get_instance()
@@ -199,56 +390,901 @@ def test(ctx, profile, max_workers, max_bid_price, debug):
             % service.behat_project_folder)
         exit()
 
+    # Only keep the feature files impacted by changes since the given git reference. Fall back to a full run if the
+    # impact of a change cannot be determined
+    if changed_since:
+        impacted = impact.select_impacted_features(service, ssh, changed_since)
+        if impacted is None:
+            click.echo('Cannot determine the impact of changes since %s. Running all feature files.' % changed_since)
+        else:
+            features = [feature for feature in features if feature in impacted]
+            if not features:
+                click.echo('No feature files impacted by changes since %s. Exiting test.' % changed_since)
+                exit()
+            click.echo('%d feature files impacted by changes since %s.' % (len(features), changed_since))
+
+    # Estimate the duration of each feature file from previous runs or else from a static analysis of its scenarios
+    # and steps. The longest tasks are queued first so they do not end up as stragglers at the end of the run
+    analysis = service.analyze_features(ssh)
+    estimates = service.estimate_feature_durations(features, analysis)
+
+    # Fingerprint the master instance so pooled workers and cached results from a different state of it are not reused
+    fingerprint = None
+    revision = None
+    if int(service.warm_pool_size) or float(service.result_cache_ttl):
+        fingerprint = service.get_master_fingerprint(ssh)
+        revision = service.get_master_revision(ssh)
+
+    # Skip the feature files which passed before with the same inputs. Their cached results are copied into the run
+    cached = {}
+    if float(service.result_cache_ttl) and not options['force_full'] and fingerprint:
+        cached = select_cached_features(service, ssh, features, analysis, fingerprint, revision)
+        if len(cached) == len(features):
+            click.echo('All %d feature files passed before with the same inputs. Use --force-full to run them anyway.'
+                % len(features))
+            exit()
+        if cached:
+            click.echo('%d feature files passed before with the same inputs and are skipped.' % len(cached))
+    queued = [feature for feature in features if feature not in cached]
+
+    # Feature files of the critical lane go into a priority queue which the workers drain before the task queue
+    priority = service.select_priority_features(features, analysis)
+    if priority:
+        click.echo('%d feature files in the critical lane.' % len(priority))
+
+    # Each task pays the fixed cost of starting Behat so pack small feature files together into tasks of up to the
+    # target duration
+    priority_tasks = scheduler.pack_tasks([feature for feature in queued if feature in priority], estimates, pack)
+    tasks = scheduler.pack_tasks([feature for feature in queued if feature not in priority], estimates, pack)
+    if pack:
+        click.echo('Packed %d feature files into %d tasks of up to %d seconds.'
+            % (len(queued), len(priority_tasks) + len(tasks), pack))
+
+    # Let the planner pick the number of workers, up to twice the configured maximum. A deadline or budget only means
+    # something to the planner so either one implies --auto-workers
+    if options['auto_workers'] or options['deadline'] is not None or options['budget'] is not None:
+        deadline = options['deadline']
+        plan = plan_run(service, priority_tasks + tasks, estimates, 2 * int(service.max_workers), slots)
+        recommended = scheduler.recommend_workers(plan, deadline * 60 if deadline else None, options['budget'])
+        if recommended:
+            max_workers = recommended['workers']
+            click.echo('Planner recommends %d workers for an estimated runtime of %.1f minutes costing $%.4f.'
+                % (max_workers, recommended['runtime'] / 60, recommended['cost']))
+        else:
+            click.echo('No number of workers meets the deadline and budget. Using %d workers.' % max_workers)
+
+    # Validate the fail-fast threshold and the result compression before any AWS resource is created
+    get_max_failures(fail_fast, len(features))
+    try:
+        transport.resolve_compression(service.result_compression)
+    except ValueError as e:
+        click.echo('%s. Exiting test.' % e)
+        exit()
+
+    return {
+        'service': service,
+        'profile': profile,
+        'prefix': None,
+        'start_time': start_time,
+        'ssh': ssh,
+        'features': features,
+        'analysis': analysis,
+        'fingerprint': fingerprint,
+        'revision': revision,
+        'cached': cached,
+        'tasks': tasks,
+        'priority_tasks': priority_tasks,
+        'max_workers': max_workers,
+        'max_bid_price': max_bid_price,
+        'pack': pack,
+        'slots': slots,
+        'regions': regions,
+        'fail_fast': fail_fast,
+        'debug': options['debug']
+    }
+
+
+def select_cached_features(service, ssh, features, analysis, fingerprint, revision):
+    """Select the feature files whose result can be taken from the result cache
+
+    A cached pass is reused when the feature file is unchanged and the master instance has the same fingerprint as in
+    the run which passed it. A pass from a run of a clean git commit is also reused when no change since that commit
+    impacts the feature file.
+
+    Args:
+        service (object): aws.AWS object
+        ssh (object): ssh connection to the master instance
+        features (list): names of feature files i.e. login.feature
+        analysis (dict): feature name to its analysis as returned by Beekeeper.analyze_features()
+        fingerprint (str): fingerprint of the master instance
+        revision (str): git commit checked out on the master instance or None if it has uncommitted changes
+
+    Returns:
+        dict: feature name to the image_id of the run it passed in
+    """
+
+    history = service.get_history()
+    since = time.time() - float(service.result_cache_ttl) * 3600
+    history.expire_passes(since)
+
+    hashes = dict([(feature, analysis[feature]['hash']) for feature in features if 'hash' in analysis.get(feature, {})])
+    passes = history.get_passes(hashes, since)
+
+    # A custom fingerprint_command may cover more than the git repository so only its fingerprint can be trusted
+    compare_revisions = revision and not service.fingerprint_command
+
+    cached = {}
+    impacted = {}
+    for feature, candidates in passes.items():
+        for cached_fingerprint, cached_revision, image_id in candidates:
+            if cached_fingerprint == fingerprint:
+                cached[feature] = image_id
+                break
+            if not compare_revisions or not cached_revision:
+                continue
+
+            # The impact of the changes since a commit is worked out once for all feature files cached at it
+            if cached_revision not in impacted:
+                impacted[cached_revision] = impact.select_impacted_features(service, ssh, cached_revision)
+            if impacted[cached_revision] is not None and feature not in impacted[cached_revision]:
+                cached[feature] = image_id
+                break
+    return cached
+
+
+def confirm_cost(ctx, run):
+    """Show the cost estimate of a run and ask to continue if the spot price exceeds the maximum bid price
+
+    Exits if the user does not want to continue.
+
+    Args:
+        ctx (object): click context
+        run (dict): run as returned by check_run() with its final number of workers
+    """
+
     # Invoke the cost command to check the current price for a spot instance
     # and to generate a cost estimate
-    current_spot_price = ctx.invoke(cost, profile=profile, max_workers=max_workers)
-    if current_spot_price > max_bid_price:
+    current_spot_price = ctx.invoke(cost, profile=run['profile'], max_workers=run['max_workers'], slots=run['slots'])
+    if current_spot_price > run['max_bid_price']:
         click.secho('Note: Current spot price of $%.4f exceeds your maximum bid price of $%.4f.'
-            % (current_spot_price, max_bid_price), fg='red', bold=True)
+            % (current_spot_price, run['max_bid_price']), fg='red', bold=True)
         if not click.confirm('Do you want to continue?'):
             click.echo('Exiting test')
             exit()
 
-    click.echo('\n--- SETUP ---')
 
-    # Invoke the snapshot command to create a snapshot of the master instance
-    image_id = ctx.invoke(snapshot, profile=profile)
-    click.echo('Elapsed time is %s' % service.elapsed_time(start_time))
+def run_echo(run, message, nl=True, **styles):
+    """Echo a message about a run. When several profiles are tested at once every message is a line of its own
+    prefixed with the profile
 
-    # Create and populate the task queue.
-    sqs_task_queue_url = service.create_task_queue(features, image_id)
-    click.echo('Created SQS Task Queue and added %d tasks' % len(features))
+    Args:
+        run (dict): run as returned by check_run() or monitoring as returned by start_monitoring()
+        message (str): message, which may start with newlines to end the progress line
+        nl (bool): end the message with a newline
+        **styles: styles for click.secho() i.e. fg='red'
+    """
+
+    if run.get('prefix'):
+        text = message.lstrip('\n')
+        message = message[:len(message) - len(text)] + '[%s] %s' % (run['prefix'], text)
+        nl = True
+    click.secho(message, nl=nl, **styles)
+    sys.stdout.flush()
+
+
+def setup_run(run):
+    """Snapshot the master instance, create the task queue and result bucket of a run and request its workers
+
+    Adds the image_id, journal and stop_launching event to the run and sets ready once the workers were requested.
+
+    Args:
+        run (dict): run as returned by check_run()
+    """
+
+    service = run['service']
+    max_workers = run['max_workers']
+    max_bid_price = run['max_bid_price']
+    pack = run['pack']
+    slots = run['slots']
+    debug = run['debug']
+
+    pool_size = int(service.warm_pool_size)
+    fingerprint = run['fingerprint']
+
+    # Without a fingerprint there is no telling which pooled volumes are current, so this run leaves the pool alone
+    if pool_size and not fingerprint:
+        run_echo(run, 'Cannot fingerprint the master instance. Not using the warm pool for this run.', fg='yellow')
+        pool_size = 0
+
+    # Create a snapshot of the master instance. The run is journaled as soon as the image id is known so it can be
+    # resumed or cleaned up with "beekeeper resume" if Beekeeper dies before the run is complete
+    run_echo(run, 'Creating AMI Image...', nl=False)
+    image_id = service.create_snapshot(wait=False)['ImageId']
+    journal = Journal(service.behat_result_folder, image_id)
+    run['image_id'] = image_id
+    run['journal'] = journal
+    journal.record('snapshot_created', image_id=image_id, profile=service.profile, max_workers=max_workers,
+        max_bid_price=max_bid_price, fail_fast=run['fail_fast'], slots=slots, debug=debug, fingerprint=fingerprint,
+        revision=run['revision'])
+    service.wait_for_snapshot(image_id)
+    journal.record('snapshot_available')
+    service.save_analysis(image_id, run['analysis'])
+    if run['cached']:
+        service.restore_cached_results(image_id, run['cached'])
+        journal.record('cached_results_restored', cached_features=sorted(run['cached'].keys()))
+    run_echo(run, 'completed. The AMI ID is %s' % image_id)
+    run_echo(run, 'Elapsed time is %s' % service.elapsed_time(run['start_time']))
+
+    # Let the workers start from fully initialized volumes instead of loading their blocks from S3 on first access
+    fast_restore_timeout = int(service.fast_snapshot_restore)
+    if fast_restore_timeout:
+        run_echo(run, 'Enabling fast snapshot restore...', nl=False)
+        state = service.enable_fast_restore(image_id, fast_restore_timeout)
+        journal.record('fast_restore_enabled', fast_restore_state=state)
+        run_echo(run, state or 'failed')
+
+    # Copy the image to the secondary regions. The copies become available while the task queue, the result bucket and
+    # the workers in the primary region are set up
+    region_images = {service.aws_region: image_id}
+    if run['regions']:
+        region_images.update(service.copy_image_to_regions(image_id, run['regions']))
+        service.save_regions(image_id, region_images)
+        journal.record('images_copied', region_images=region_images)
+        run_echo(run, 'Copying the AMI image to %s' % ', '.join(sorted(region_images.keys())))
+
+    # Create and populate the task queue. The manifest lists the tasks in the order the workers pick them up
+    sqs_task_queue_url = service.create_task_queue(run['tasks'], image_id)
+    sqs_priority_queue_url = None
+    if run['priority_tasks']:
+        sqs_priority_queue_url = service.create_priority_queue(run['priority_tasks'], image_id)
+        run_echo(run, 'Created SQS Priority Queue and added %d tasks' % len(run['priority_tasks']))
+    journal.record('task_queue_created', queue_url=sqs_task_queue_url, priority_queue_url=sqs_priority_queue_url,
+        tasks=run['priority_tasks'] + run['tasks'], priority_tasks=run['priority_tasks'])
+    run_echo(run, 'Created SQS Task Queue and added %d tasks' % len(run['tasks']))
 
     # Create an S3 bucket to hold the test results
-    s3_result_bucket_name = service.create_result_bucket(image_id, len(features))
-    click.echo('Created S3 Result Bucket')
+    s3_result_bucket_name = service.create_result_bucket(image_id, len(run['features']))
+    journal.record('result_bucket_created', bucket_name=s3_result_bucket_name)
+    run_echo(run, 'Created S3 Result Bucket')
+
+    # Spread the workers over the regions by their spot price
+    allocation = {service.aws_region: max_workers}
+    if len(region_images) > 1:
+        allocation = spread_workers(service, region_images.keys(), max_workers, max_bid_price)
+        run_echo(run, 'Spreading workers over regions: %s' % ', '.join(['%s %d' % (region, count)
+            for region, count in sorted(allocation.items())]))
+
+    # Workers in secondary regions are requested in the background as soon as the copy of the image is available
+    stop_launching = threading.Event()
+    run['stop_launching'] = stop_launching
+    for region, count in sorted(allocation.items()):
+        if region == service.aws_region:
+            continue
+        launcher = threading.Thread(target=launch_regional_workers, args=(service, journal, stop_launching, region,
+            region_images[region], count, max_bid_price, sqs_task_queue_url, s3_result_bucket_name, debug,
+            bool(pack), slots, sqs_priority_queue_url))
+        launcher.daemon = True
+        launcher.start()
+
+    # Start the stopped workers of the warm pool instead of requesting new spot instances for them
+    primary_workers = allocation.get(service.aws_region, 0)
+    joining = 0
+    if pool_size:
+        service.expire_pool(float(service.warm_pool_ttl))
+        pool = service.get_pool()
+        stopped = [worker for worker in pool if worker['state'] == 'stopped'][:primary_workers]
+
+        # Workers whose volume was built from a different state of the master instance get a volume of the new snapshot
+        stale = [worker for worker in stopped if worker['fingerprint'] != fingerprint]
+        if stale:
+            run_echo(run, 'Refreshing the volume of %d workers in the warm pool' % len(stale))
+            service.refresh_pool(stale, image_id, fingerprint)
+
+        user_data = service.get_user_data(sqs_task_queue_url, s3_result_bucket_name, True, bool(pack), slots,
+            sqs_priority_queue_url)
+        started = service.start_pool(stopped, image_id, user_data)
+        journal.record('pool_started', pool_instance_ids=started)
+        run_echo(run, 'Started %d workers from the warm pool' % len(started))
+
+        # Grow the pool up to its size with the new workers of this run
+        primary_workers -= len(started)
+        joining = max(0, min(primary_workers, pool_size - len(pool)))
 
     # Create the workers
-    print('Requesting %d spot instances...' % max_workers, end="")
-    sys.stdout.flush()
-    response = service.create_spot_instances(image_id, max_workers, max_bid_price, sqs_task_queue_url, s3_result_bucket_name, debug)
-    click.echo('fulfilled')
-    click.echo('Elapsed time is %s' % service.elapsed_time(start_time))
+    run_echo(run, 'Requesting %d spot instances...' % primary_workers, nl=False)
+    responses = []
+    if joining:
+        responses.append(service.create_spot_instances(image_id, joining, max_bid_price, sqs_task_queue_url,
+            s3_result_bucket_name, debug, batched_tasks=bool(pack), slots=slots, pool_fingerprint=fingerprint,
+            sqs_priority_queue_url=sqs_priority_queue_url))
+    if primary_workers - joining:
+        responses.append(service.create_spot_instances(image_id, primary_workers - joining, max_bid_price,
+            sqs_task_queue_url, s3_result_bucket_name, debug, batched_tasks=bool(pack), slots=slots,
+            sqs_priority_queue_url=sqs_priority_queue_url))
+    journal.record('workers_requested', spot_request_ids=[request['SpotInstanceRequestId']
+        for response in responses for request in (response or {}).get('SpotInstanceRequests', [])])
+    run_echo(run, 'fulfilled')
+    run_echo(run, 'Elapsed time is %s' % service.elapsed_time(run['start_time']))
+    run['ready'] = True
+
+
+def test_profiles(ctx, profiles, options, max_total_workers):
+    """Test several profiles at once
+
+    The runs are set up concurrently and watched by a single monitor loop. Each run is cleaned up as soon as it is
+    complete and reported once all of them are.
+
+    Args:
+        ctx (object): click context
+        profiles (list): Beekeeper profiles
+        options (dict): options of the test command
+        max_total_workers (int): maximum number of workers across all runs
+    """
+
+    start_time = time.time()
+
+    # Every run needs at least one worker, so refuse more profiles than the global cap before anything is checked
+    max_total_workers = max_total_workers or int(get_service(ctx, profiles[0]).max_total_workers)
+    if max_total_workers and len(profiles) > max_total_workers:
+        click.echo('Cannot test %d profiles at once with at most %d workers in total. Exiting test.'
+            % (len(profiles), max_total_workers))
+        exit()
+
+    # Check the profiles one after the other so their output does not interleave
+    runs = []
+    for profile in profiles:
+        click.echo('\n--- CHECK %s ---' % profile)
+        try:
+            runs.append(check_run(ctx, profile, options))
+        except SystemExit:
+            click.echo('Skipping profile %s' % profile)
+    if not runs:
+        exit()
+
+    # Keep the workers of all runs within the global cap
+    if max_total_workers:
+        capped = scheduler.cap_workers([run['max_workers'] for run in runs], max_total_workers)
+        for run, workers in zip(runs, capped):
+            if workers < run['max_workers']:
+                click.echo('Capping profile %s at %d workers to stay within %d workers in total'
+                    % (run['profile'], workers, max_total_workers))
+            run['max_workers'] = workers
+
+    # Confirm the cost of each run with the number of workers it will actually launch
+    confirmed = []
+    for run in runs:
+        click.echo('\n--- COST %s ---' % run['profile'])
+        try:
+            confirm_cost(ctx, run)
+            confirmed.append(run)
+        except SystemExit:
+            click.echo('Skipping profile %s' % run['profile'])
+    runs = confirmed
+    if not runs:
+        exit()
+
+    click.echo('\n--- SETUP ---')
+    setups = []
+    for run in runs:
+        run['prefix'] = run['profile']
+        setup = threading.Thread(target=setup_run, args=(run,))
+        setup.daemon = True
+        setup.start()
+        setups.append(setup)
+    for setup in setups:
+        setup.join()
+
+    # A run which stopped during setup can be cleaned up with "beekeeper resume"
+    for run in runs:
+        if not run.get('ready'):
+            click.secho('Setup of profile %s failed. Use beekeeper resume to clean it up.' % run['profile'], fg='red')
+    runs = [run for run in runs if run.get('ready')]
+    if not runs:
+        exit()
 
     click.echo('\n--- WORK ---')
-    click.echo('%d workers launched and preparing to test' % max_workers)
+    click.echo('%d workers launched and preparing to test' % sum([run['max_workers'] for run in runs]))
+    for run in runs:
+        run['monitoring'] = start_monitoring(run['service'], run['image_id'], run['fail_fast'], run['profile'])
+
+    show_combined_progress(runs)
+    while [run for run in runs if 'results' not in run]:
+        try:
+            for run in runs:
+                if 'results' in run or not run['monitoring']:
+                    continue
+                poll_run(run['monitoring'])
+                if run['monitoring']['remaining_tasks'] > 0 and not run['monitoring']['aborted']:
+                    continue
+
+                # Stop paying for a run as soon as it is complete
+                run['results'] = finish_monitoring(run['monitoring'])
+                run['journal'].record('monitor_finished')
+                run['stop_launching'].set()
+                click.echo('\n[%s] Tests completed at %s. Cleaning up.'
+                    % (run['profile'], run['service'].timestamp('%H:%M:%S', False)))
+                ctx.invoke(cleanup, profile=run['profile'], image_id=run['image_id'])
+                run['journal'].record('cleanup_finished')
+
+            # Runs whose monitoring could not be initialized are left for "beekeeper resume"
+            for run in runs:
+                if not run['monitoring'] and 'results' not in run:
+                    click.secho('\nFailed to initialize monitoring of profile %s. Use beekeeper resume to continue.'
+                        % run['profile'], fg='red')
+                    run['results'] = None
+
+            show_combined_progress(runs)
+            if [run for run in runs if 'results' not in run]:
+                time.sleep(10)
+        except KeyboardInterrupt:
+            click.echo('\nExiting monitor mode')
+            exit()
+    click.echo()
+    click.echo('Tests completed at %s. Total elapsed time is %s'
+        % (runs[0]['service'].timestamp('%H:%M:%S', False), runs[0]['service'].elapsed_time(start_time)))
 
-    # Invoke the monitor command
-    ctx.invoke(monitor, image_id=image_id)
-    elapsed = int(time.time() - start_time)
-    click.echo('Tests completed at %s. Total elapsed time is %s' % (service.timestamp('%H:%M:%S', False), service.elapsed_time(start_time)))
+    click.echo('\n--- REPORT ---')
+    for run in runs:
+        service = run['service']
+        click.echo('\nProfile %s (%s)' % (run['profile'], run['image_id']))
+        display_results(run['results'], max_receive_count=service.max_receive_count)
+        display_boot_latencies(service.get_boot_latencies(run['image_id']))
+        if run['results'] is not None:
+            run['journal'].record('report_finished')
+    click.echo('\n%d AWS calls saved by the run cache' % sum([run['service'].calls_saved for run in runs]))
+
+
+def show_combined_progress(runs):
+    """Overwrite the progress line with the remaining tests, failed scenarios and ETA of every run"""
+    parts = []
+    for run in runs:
+        monitoring = run.get('monitoring')
+        if 'results' in run or not monitoring:
+            parts.append('%s: done' % run['profile'])
+            continue
+        part = '%s: %d remaining, %d failed' % (run['profile'], monitoring['remaining_tasks'],
+            monitoring['aggregator'].get_totals()['scenarios']['failed'])
+        if monitoring['eta']:
+            part += ', ETA %.1f min' % (monitoring['eta']['seconds'] / 60)
+        parts.append(part)
+    click.echo('\r' + '   '.join(parts) + '   ', nl=False)
 
-    # Invoke cleanup command
-    click.echo('\n--- Cleanup ---')
-    ctx.invoke(cleanup, image_id=image_id)
 
-    # Generate a summary of the test results
+@cli.command()
+@click.argument('image_id', required=False, default=None)
+@click.pass_context
+def resume(ctx, image_id):
+    """Resume monitoring, cleanup and reporting of a run"""
+
+    # Runs are journaled in the result folder of the profile they were started with
+    journals = []
+    for profile in beekeeper.Beekeeper().list_profiles():
+        settings = beekeeper.Beekeeper(profile)
+        if image_id:
+            candidates = [image_id]
+        else:
+            candidates = [os.path.basename(folder) for folder in glob.glob(settings.behat_result_folder + '/*')]
+        for candidate in candidates:
+            journal = Journal(settings.behat_result_folder, candidate)
+            if journal.exists() and journal.path not in [existing.path for existing in journals]:
+                journals.append(journal)
+
+    # Without an image id, pick the most recent run which was not completed
+    if not image_id:
+        journals = [journal for journal in journals if 'report_finished' not in journal.get_state()['events']]
+        journals.sort(key=lambda journal: os.path.getmtime(journal.path), reverse=True)
+    if not journals:
+        click.echo('No run found to resume')
+        exit()
+
+    journal = journals[0]
+    state = journal.get_state()
+    image_id = state['image_id']
+    profile = state['profile']
+    service = get_service(ctx, profile)
+    click.echo('Resuming run %s of profile %s after phase %s' % (image_id, profile, state['last_event']))
+
+    # A run which stopped during setup cannot be continued, only cleaned up
+    if 'workers_requested' not in state['events']:
+        click.echo('The run stopped before its workers were requested.')
+        if click.confirm('Do you want to clean up its AWS resources?'):
+            if 'snapshot_available' not in state['events']:
+                service.wait_for_snapshot(image_id)
+            ctx.invoke(cleanup, profile=profile, image_id=image_id)
+            journal.record('cleanup_finished')
+        exit()
+
+    results = None
+    if 'monitor_finished' not in state['events']:
+        click.echo('\n--- WORK ---')
+        results = ctx.invoke(monitor, image_id=image_id, profile=profile, fail_fast=state.get('fail_fast'))
+        journal.record('monitor_finished')
+
+    if 'cleanup_finished' not in state['events']:
+        click.echo('\n--- Cleanup ---')
+        ctx.invoke(cleanup, profile=profile, image_id=image_id)
+        journal.record('cleanup_finished')
 
     click.echo('\n--- REPORT ---')
-    ctx.invoke(report, image_id=image_id)
+    display_results(results or service.summarize_results(image_id), max_receive_count=service.max_receive_count)
+    display_boot_latencies(service.get_boot_latencies(image_id))
+    journal.record('report_finished')
 
 
 
+@cli.command()
+@click.argument('profile', default='default')
+@click.option('--deadline', type=float, metavar='MINUTES', help='Latest acceptable runtime')
+@click.option('--budget', type=float, metavar='DOLLARS', help='Highest acceptable cost')
+@click.option('--max_workers', type=int, help='Largest number of workers to simulate. Default to twice the configured max_workers')
+@click.option('--slots', type=int, help='Number of Behat processes per worker')
+@click.pass_context
+def plan(ctx, profile, deadline, budget, max_workers, slots):
+    """Recommend the number of workers for a deadline or budget"""
+    service = get_service(ctx, profile)
+    max_workers = max_workers if max_workers else 2 * int(service.max_workers)
+    slots = slots if slots else int(service.slots_per_worker)
+
+    # Estimate the tasks of a run the same way test does
+    ssh = service.get_ssh_connection()
+    analysis = service.analyze_features(ssh)
+    estimates = service.estimate_feature_durations(analysis.keys(), analysis)
+    tasks = scheduler.pack_tasks(analysis.keys(), estimates, int(service.pack_target))
+
+    startup = service.get_startup_times()
+    plan = plan_run(service, tasks, estimates, max_workers, slots)
+    recommended = scheduler.recommend_workers(plan, deadline * 60 if deadline else None, budget)
+
+    fmt = '{0:30}: {1}'
+    click.echo()
+    click.echo(fmt.format('Beekeeper Profile', service.profile))
+    click.echo(fmt.format('Tasks', len(tasks)))
+    click.echo(fmt.format('Slots per Worker', slots))
+    click.echo(fmt.format('Sequential Runtime', '%.1f minutes' % (sum(estimates.values()) / 60)))
+    click.echo(fmt.format('Snapshot Time', '%.1f minutes' % (startup['snapshot'] / 60)))
+    click.echo(fmt.format('Spot Fulfillment Time', '%.1f minutes' % (startup['fulfillment'] / 60)))
+    click.echo(fmt.format('Boot Until First Result', '%.1f minutes' % (startup['boot'] / 60)))
+    click.echo(fmt.format('Startup Measured From', '%d runs' % startup['runs'] if startup['runs'] else 'defaults'))
+    click.echo()
+
+    header_fmt = '{0:>7} {1:>16} {2:>10}'
+    line_fmt = '{0:7d} {1:16.1f} {2:10.4f} {3}'
+    click.echo(header_fmt.format('Workers', 'Runtime (mins)', 'Cost ($)'))
+    click.echo(header_fmt.format('-------', '--------------', '--------'))
+    for entry in plan:
+        line = line_fmt.format(entry['workers'], entry['runtime'] / 60, entry['cost'], '')
+        if entry is recommended:
+            click.secho(line_fmt.format(entry['workers'], entry['runtime'] / 60, entry['cost'], '<- recommended'), bold=True)
+        else:
+            click.echo(line)
+    click.echo()
+
+    if recommended:
+        click.echo('Recommended number of workers is %d' % recommended['workers'])
+    else:
+        click.echo('No number of workers up to %d meets the deadline and budget' % max_workers)
+    return recommended
+
+
+def plan_run(service, tasks, estimates, max_workers, slots=1):
+    """Simulate a run with the current spot price and measured startup times for every number of workers
+
+    Args:
+        service (object): aws.AWS object
+        tasks (list): of tasks in queue order, each a list of feature names
+        estimates (dict): feature name to estimated duration in seconds
+        max_workers (int): largest number of workers to simulate
+        slots (int): number of Behat processes per worker
+
+    Returns:
+        list: as returned by scheduler.plan_workers()
+    """
+
+    durations = [sum([estimates[feature] for feature in task]) for task in tasks]
+    spot_result = service.get_spot_instance_price()
+    volume_size = float(service.get_volume()['Volumes'][0]['Size'])
+    storage_price = service.get_storage_price(service.aws_region)
+    speedup = service.get_slot_speedup(spot_result['instance_type'], slots)
+    return scheduler.plan_workers(durations, service.get_startup_times(), spot_result['price'], volume_size,
+        storage_price, max_workers, slots, speedup)
+
+
+@cli.command('benchmark-slots')
+@click.argument('profile', default='default')
+@click.option('--slots', default='1,2,4', help='Comma separated numbers of slots to benchmark. Default to 1,2,4')
+@click.option('--sample', default=8, help='Number of representative feature files to run with every number of slots')
+@click.option('--max_bid_price', type=float, help='Maximium bid price for a spot instance')
+@click.option('--timeout', default=60, help='Minutes to wait for the benchmark to finish')
+@click.pass_context
+def benchmark_slots(ctx, profile, slots, sample, max_bid_price, timeout):
+    """Measure the best number of slots per worker"""
+    service = get_service(ctx, profile)
+    max_bid_price = max_bid_price if max_bid_price else float(service.max_bid_price)
+    instance_type = service.get_worker_instance_type()
+
+    # The speedup of every number of slots is measured against a single slot
+    try:
+        slot_counts = sorted(set([1] + [int(value) for value in slots.split(',')]))
+    except ValueError:
+        raise click.BadParameter('%s is not a comma separated list of numbers' % slots, param_hint='--slots')
+
+    # Every slot needs a few feature files to stay busy for the whole benchmark
+    features = select_benchmark_sample(service, max(sample, 2 * max(slot_counts)))
+    variants = [{'instance_type': instance_type, 'slots': count} for count in slot_counts]
+    measurements = run_benchmark(ctx, service, features, variants, max_bid_price, timeout)
+
+    header_fmt = '{0:>5} {1:>9} {2:>16} {3:>18} {4:>7}'
+    line_fmt = '{0:5d} {1:>9} {2:16.1f} {3:18.1f} {4:7.2f}'
+    click.echo()
+    click.echo('Instance type %s' % instance_type)
+    click.echo(header_fmt.format('Slots', 'Completed', 'Avg Feature (s)', 'Features per Hour', 'Speedup'))
+    click.echo(header_fmt.format('-----', '---------', '---------------', '-----------------', '-------'))
+    single = measurements[0][1]['throughput']
+    for variant, measurement in measurements:
+        click.echo(line_fmt.format(variant['slots'], '%d/%d' % (measurement['completed'], measurement['features']),
+            measurement['work'] / max(1, measurement['completed']), measurement['throughput'],
+            measurement['throughput'] / single if single else 0.0))
+    click.echo()
+
+    # Only runs which completed every feature file are fair to compare
+    complete = [(variant, measurement) for variant, measurement in measurements
+        if measurement['completed'] == measurement['features']]
+    if not complete:
+        click.echo('No benchmark run completed. Try a longer --timeout.')
+        return None
+
+    best = max(complete, key=lambda item: item[1]['throughput'])[0]['slots']
+    click.echo('The best number of slots for %s is %d' % (instance_type, best))
+    if best != int(service.slots_per_worker) and click.confirm('Save slots_per_worker = %d to profile %s?'
+            % (best, service.profile)):
+        service.save_setting('slots_per_worker', best)
+    return best
+
+
+@cli.command('benchmark-types')
+@click.argument('profile', default='default')
+@click.option('--types', 'instance_types', required=True,
+    help='Comma separated candidate instance types i.e. m4.large,c4.xlarge,m4.xlarge')
+@click.option('--sample', default=8, help='Number of representative feature files to run on every instance type')
+@click.option('--slots', type=int, help='Number of Behat processes per worker. Default to slots_per_worker')
+@click.option('--max_bid_price', type=float, help='Maximium bid price for a spot instance')
+@click.option('--timeout', default=60, help='Minutes to wait for the benchmark to finish')
+@click.pass_context
+def benchmark_types(ctx, profile, instance_types, sample, slots, max_bid_price, timeout):
+    """Measure the instance type which gets the most done per dollar"""
+    service = get_service(ctx, profile)
+    max_bid_price = max_bid_price if max_bid_price else float(service.max_bid_price)
+    slots = slots if slots else int(service.slots_per_worker)
+
+    # Skip the instance types which are not offered as spot instances or cost more than the maximum bid
+    variants = []
+    for instance_type in [value.strip() for value in instance_types.split(',') if value.strip()]:
+        price = service.get_spot_instance_price(instance_type)
+        if not price or price['price'] > max_bid_price:
+            click.echo('Skipping %s. Its spot price is above the maximum bid price of $%.4f.' % (instance_type, max_bid_price))
+            continue
+        variants.append({'instance_type': instance_type, 'slots': slots})
+    if not variants:
+        click.echo('No instance type to benchmark. Exiting benchmark.')
+        exit()
+
+    features = select_benchmark_sample(service, max(sample, 2 * slots))
+    measurements = run_benchmark(ctx, service, features, variants, max_bid_price, timeout)
+
+    header_fmt = '{0:14} {1:>9} {2:>16} {3:>9} {4:>11} {5:>16} {6:>17}'
+    line_fmt = '{0:14} {1:>9} {2:16.1f} {3:>9} {4:11.4f} {5:16.5f} {6:17.1f}'
+    click.echo()
+    click.echo(header_fmt.format('Instance Type', 'Completed', 'Avg Feature (s)', 'Boot (s)', 'Price ($/h)',
+        'Cost per Feature', 'Features per $'))
+    click.echo(header_fmt.format('-------------', '---------', '---------------', '--------', '-----------',
+        '----------------', '--------------'))
+    for variant, measurement in measurements:
+        click.echo(line_fmt.format(variant['instance_type'],
+            '%d/%d' % (measurement['completed'], measurement['features']),
+            measurement['work'] / max(1, measurement['completed']),
+            '%d' % measurement['boot'] if measurement['boot'] is not None else '-',
+            measurement['price'],
+            get_cost_per_feature(measurement),
+            measurement['throughput'] / measurement['price'] if measurement['price'] else 0.0))
+    click.echo()
+
+    # Only runs which completed every feature file are fair to compare
+    complete = [(variant, measurement) for variant, measurement in measurements
+        if measurement['completed'] == measurement['features'] and measurement['throughput']]
+    if not complete:
+        click.echo('No benchmark run completed. Try a longer --timeout.')
+        return None
+
+    best = min(complete, key=lambda item: get_cost_per_feature(item[1]))[0]['instance_type']
+    click.echo('The instance type with the lowest cost per feature file is %s' % best)
+    if best != service.get_worker_instance_type() and click.confirm('Save worker_instance_type = %s to profile %s?'
+            % (best, service.profile)):
+        service.save_setting('worker_instance_type', best)
+    return best
+
+
+def get_cost_per_feature(measurement):
+    """Get the spot cost of completing one feature file at the throughput of a benchmark run"""
+    if not measurement['throughput']:
+        return 0.0
+    return measurement['price'] / measurement['throughput']
+
+
+def select_benchmark_sample(service, size):
+    """Select feature files spread evenly over the range of estimated durations
+
+    Args:
+        service (object): aws.AWS object
+        size (int): number of feature files
+
+    Returns:
+        list: of feature file names
+    """
+
+    ssh = service.get_ssh_connection()
+    analysis = service.analyze_features(ssh)
+    if not analysis:
+        click.echo('No Behat feature file found in %s. Exiting benchmark.' % service.behat_project_folder)
+        exit()
+    estimates = service.estimate_feature_durations(analysis.keys(), analysis)
+    return scheduler.select_sample(estimates, size)
+
+
+def run_benchmark(ctx, service, features, variants, max_bid_price, timeout):
+    """Run the same feature files on one worker per variant using the normal task queue and result bucket flow
+
+    Every variant gets a run of its own named after the image, instance type and slots. Its results are kept in the
+    result folder next to a benchmark.json file so they never count as the results of a test.
+
+    Args:
+        ctx (object): click context
+        service (object): aws.AWS object
+        features (list): of feature file names
+        variants (list): of dicts with the instance_type and slots of each worker
+        max_bid_price (float): maximum bid price for a spot instance
+        timeout (int): minutes to wait for the benchmark runs to finish
+
+    Returns:
+        list: of (variant, measurement) tuples in the order of the variants
+    """
+
+    # Validate the result compression before any AWS resource is created
+    try:
+        transport.resolve_compression(service.result_compression)
+    except ValueError as e:
+        click.echo('%s. Exiting benchmark.' % e)
+        exit()
+
+    click.echo('\n--- SETUP ---')
+    click.echo('Benchmarking %d feature files: %s' % (len(features), ', '.join(features)))
+    image_id = ctx.invoke(snapshot, profile=service.profile)
+    created = time.time()
+
+    for variant in variants:
+        variant['run_id'] = '%s-%s-%d' % (image_id, variant['instance_type'].replace('.', '-'), variant['slots'])
+        result_folder = service.behat_result_folder + '/' + variant['run_id']
+        if not os.path.isdir(result_folder):
+            os.makedirs(result_folder)
+        with open(result_folder + '/benchmark.json', 'w') as f:
+            json.dump({'image_id': image_id, 'instance_type': variant['instance_type'], 'slots': variant['slots'],
+                'features': features}, f)
+
+        queue_url = service.create_task_queue([[feature] for feature in features], variant['run_id'])
+        bucket_name = service.create_result_bucket(variant['run_id'], len(features))
+        variant['requested'] = time.time()
+        service.create_spot_instances(image_id, 1, max_bid_price, queue_url, bucket_name, False, slots=variant['slots'],
+            instance_type=variant['instance_type'])
+        click.echo('Requested a worker for %s with %d slots' % (variant['instance_type'], variant['slots']))
+
+    click.echo('\n--- WORK ---')
+    pending = variants[:]
+    deadline = time.time() + timeout * 60
+    try:
+        while pending and time.time() < deadline:
+            for variant in pending[:]:
+                if service.download_results(variant['run_id']) and 'first_result' not in variant:
+                    variant['first_result'] = time.time()
+                if service.count_completed_tasks(variant['run_id']) >= len(features):
+                    pending.remove(variant)
+            click.echo('\rBenchmark runs remaining: %d   ' % len(pending), nl=False)
+            if pending:
+                time.sleep(10)
+    except KeyboardInterrupt:
+        click.echo('\nStopping the benchmark')
+    click.echo()
+
+    click.echo('\n--- Cleanup ---')
+    service.terminate_workers(image_id)
+    for variant in variants:
+        service.delete_run_resources(variant['run_id'])
+    service.delete_image(image_id)
+
+    measurements = []
+    for variant in variants:
+        measurement = measure_benchmark(service, variant, len(features))
+        service.get_history().record_benchmark(variant['run_id'], variant['instance_type'], variant['slots'], created,
+            measurement)
+        measurements.append((variant, measurement))
+    return measurements
+
+
+def measure_benchmark(service, variant, feature_count):
+    """Measure the throughput of a benchmark run from the durations Behat reported
+
+    A worker with n busy slots completes n feature files per average feature duration, which does not depend on how
+    long the worker took to boot or how long it sat idle at the end of the run.
+
+    Args:
+        service (object): aws.AWS object
+        variant (dict): instance_type, slots, run_id and request times of the benchmark run
+        feature_count (int): number of feature files in the benchmark
+
+    Returns:
+        dict: features, completed, work (seconds), throughput (feature files per hour), boot (seconds until the first
+              result) and price (spot price per hour)
+    """
+
+    result_folder = service.behat_result_folder + '/' + variant['run_id']
+    durations = [service.parse_result_file(path)['duration'] for path in glob.glob(result_folder + '/*.result')]
+    durations = [duration for duration in durations if duration]
+    work = sum(durations)
+
+    return {
+        'features': feature_count,
+        'completed': len(durations),
+        'work': work,
+        'throughput': variant['slots'] * len(durations) * 3600 / work if work else 0.0,
+        'boot': variant['first_result'] - variant['requested'] if 'first_result' in variant else None,
+        'price': service.get_spot_instance_price(variant['instance_type'])['price']
+    }
+
+
+def spread_workers(service, regions, max_workers, max_bid_price):
+    """Spread the workers of a run over regions by their current spot price
+
+    Args:
+        service (object): aws.AWS object
+        regions (list): of region codes
+        max_workers (int): number of workers of the run
+        max_bid_price (float): maximum bid price for a spot instance
+
+    Returns:
+        dict: region to number of workers
+    """
+
+    prices = {}
+    for region in regions:
+        spot_result = service.get_spot_instance_price(region=region)
+        if spot_result and spot_result['price'] <= max_bid_price:
+            prices[region] = spot_result['price']
+        else:
+            click.echo('Not using region %s. Its spot price is above the maximum bid price.' % region)
+
+    # Fall back to the region of the profile and let the bid price sort it out as before
+    return scheduler.spread_workers(prices, max_workers) or {service.aws_region: max_workers}
+
+
+def launch_regional_workers(service, journal, stop_launching, region, image_id, count, max_bid_price, sqs_task_queue_url,
+                            s3_result_bucket_name, debug, batched_tasks, slots, sqs_priority_queue_url=None):
+    """Wait for the copy of the image in a secondary region and request the workers of that region
+
+    Runs in a background thread while the workers in the primary region are requested and monitored.
+    """
+
+    try:
+        service.wait_for_snapshot(image_id, region)
+    except Exception as e:
+        service.log_error(e)
+        return
+
+    if stop_launching.is_set():
+        return
+    response = service.create_spot_instances(image_id, count, max_bid_price, sqs_task_queue_url, s3_result_bucket_name,
+        debug, batched_tasks=batched_tasks, slots=slots, region=region, sqs_priority_queue_url=sqs_priority_queue_url)
+    journal.record('regional_workers_requested', region=region, regional_spot_request_ids=[
+        request['SpotInstanceRequestId'] for request in (response or {}).get('SpotInstanceRequests', [])])
+
+
 @cli.command()
 @click.argument('profile', default='default')
 def start(profile):
@@ -269,49 +1305,259 @@ def stop(profile):
 
 @cli.command()
 @click.argument('image_id')
+@click.option('--profile', default='default', help='Beekeeper profile the run was started with')
+@click.option('--fail-fast', 'fail_fast', metavar='N|N%',
+    help='Abort the run once N feature files (or N% of all feature files) have failed')
 @click.pass_context
-def monitor(ctx, image_id):
+def monitor(ctx, image_id, profile, fail_fast):
     """Monitor progress and download results"""
-    service = aws.AWS()
-
-    # Initialize monitoring
-    result_status = service.initialize_monitoring(image_id)
+    service = get_service(ctx, profile)
 
     # Exit monitoring if the initializing process failed
-    if not result_status:
+    monitoring = start_monitoring(service, image_id, fail_fast)
+    if not monitoring:
         click.echo('Failed to initialize monitoring. Exiting.')
         exit()
 
-    total_tasks = int(result_status['total_tasks'])
-    completed_tasks = int(result_status['completed_tasks'])
-    remaining_tasks = total_tasks - completed_tasks
-
-    print('Number of tests remaining...%d' % remaining_tasks, end="")
-    sys.stdout.flush()
-    while remaining_tasks > 0:
+    show_progress(monitoring['remaining_tasks'], monitoring['aggregator'].get_totals())
+    while monitoring['remaining_tasks'] > 0:
         try:
-            downloaded = service.download_results(image_id)
-            if downloaded:
-                for filename in downloaded:
-                    completed_tasks += 1
-                    remaining_tasks = total_tasks - completed_tasks
-                    print ("...%d" % remaining_tasks, end="")
-                    sys.stdout.flush()
+            poll_run(monitoring)
+            if monitoring['aborted']:
+                break
+            show_progress(monitoring['remaining_tasks'], monitoring['aggregator'].get_totals(), monitoring['eta'])
+
+            if monitoring['remaining_tasks'] > 0:
+                time.sleep(10)
         except KeyboardInterrupt:
             click.echo('\nExiting monitor mode')
             exit()
-
-        time.sleep(10)
-        print(".", end="")
-        sys.stdout.flush()
     click.echo()
 
+    return finish_monitoring(monitoring)
+
+
+def start_monitoring(service, image_id, fail_fast, prefix=None):
+    """Start monitoring a run
+
+    Args:
+        service (object): aws.AWS object
+        image_id (str): image_id of a Beekeeper run
+        fail_fast (str): fail-fast threshold of the run
+        prefix (str): profile to prefix messages with when several profiles are tested at once
+
+    Returns:
+        dict: state of the monitoring, which poll_run() updates, or None if monitoring cannot be initialized
+    """
+
+    # Initialize monitoring
+    result_status = service.initialize_monitoring(image_id)
+    if not result_status:
+        return None
+
+    total_tasks = int(result_status['total_tasks'])
+    completed_tasks = int(result_status['completed_tasks'])
+
+    # Parse results in a background thread as they are downloaded so the report is ready once the run completes
+    aggregator = pipeline.ResultAggregator(service, image_id)
+    aggregator.load_existing()
+    aggregator.start()
+
+    # Record when the first result arrives so the planner can measure the boot time of the workers
+    journal = Journal(service.behat_result_folder, image_id)
+    state = journal.get_state()
+
+    # Estimate the remaining work from the queued task manifest. Runs started without a journal have no manifest
+    manifest = state.get('tasks')
+    estimates = None
+    if manifest:
+        features = [feature for task in manifest for feature in task]
+        estimates = service.estimate_feature_durations(features, service.load_analysis(image_id))
+
+    return {
+        'service': service,
+        'image_id': image_id,
+        'prefix': prefix,
+        'fail_fast': fail_fast,
+        'max_failures': get_max_failures(fail_fast, total_tasks),
+        'total_tasks': total_tasks,
+        'remaining_tasks': total_tasks - completed_tasks,
+        'aggregator': aggregator,
+        'journal': journal,
+        'state': state,
+        'first_result': 'first_result' in state['events'],
+        'manifest': manifest,
+        'estimates': estimates,
+        'eta': None,
+        'eta_recorded': 0,
+        'priority': set([feature for task in state.get('priority_tasks', []) for feature in task]),
+        'priority_reported': 'priority_finished' in state['events'],
+        'aborted': False
+    }
+
+
+def poll_run(monitoring):
+    """Download the new results of a run, replace its interrupted workers and abort it once it fails fast
+
+    Args:
+        monitoring (dict): state of the monitoring as returned by start_monitoring()
+    """
+
+    service = monitoring['service']
+    image_id = monitoring['image_id']
+    aggregator = monitoring['aggregator']
+    journal = monitoring['journal']
+
+    for filename in service.download_results(image_id):
+        aggregator.add_result(filename)
+        if not monitoring['first_result'] and journal.exists():
+            journal.record('first_result')
+            monitoring['first_result'] = True
+
+    # Tasks which exceeded their retry budget are finished, albeit with an error
+    for feature in service.download_dead_letters(image_id):
+        aggregator.add_dead_letter(feature)
+
+    # Replace workers reclaimed by AWS and put their in-flight task back into the queue
+    for interruption in service.replace_interrupted_workers(image_id):
+        if interruption['event'] == 'capacity_move':
+            run_echo(monitoring, '\nSpot request %s cannot be fulfilled (%s). Moved it to %s as %s.'
+                % (interruption['request_id'], interruption['status'], interruption['region'],
+                interruption['replacement_id']), fg='yellow')
+            continue
+        run_echo(monitoring, '\nWorker %s was interrupted (%s). Requested replacement %s.'
+            % (interruption['instance_id'] or interruption['request_id'], interruption['status'],
+            interruption['replacement_id']), fg='yellow')
+
+    monitoring['remaining_tasks'] = monitoring['total_tasks'] - service.count_completed_tasks(image_id)
+
+    # Report the verdict of the critical lane as soon as all of its feature files are finished
+    if monitoring['priority'] and not monitoring['priority_reported']:
+        failed = service.get_priority_verdict(image_id, monitoring['priority'])
+        if failed is not None:
+            journal.record('priority_finished', priority_failed=failed)
+            monitoring['priority_reported'] = True
+            if failed:
+                run_echo(monitoring, '\nCritical lane FAILED: %s' % ', '.join(failed), fg='red', bold=True)
+            else:
+                run_echo(monitoring, '\nCritical lane passed: %d feature files' % len(monitoring['priority']),
+                    fg='green', bold=True)
+    if monitoring['estimates']:
+        state = monitoring['state']
+        eta = get_eta(service, image_id, monitoring['manifest'], monitoring['estimates'], state.get('max_workers'),
+            state.get('slots'))
+        monitoring['eta'] = eta
+
+        # Write the ETA to the journal once a minute so its accuracy can be checked after the run
+        if time.time() - monitoring['eta_recorded'] >= 60:
+            journal.record('eta', eta_seconds=eta['seconds'], eta_work=eta['work'], eta_workers=eta['workers'])
+            monitoring['eta_recorded'] = time.time()
+
+    # Stop paying for a run that is already known to be broken
+    failed_features = aggregator.count_failed_features()
+    max_failures = monitoring['max_failures']
+    if max_failures and failed_features >= max_failures and monitoring['remaining_tasks'] > 0:
+        run_echo(monitoring, '\n%d feature files failed which reaches the fail-fast threshold of %s. Aborting the run.'
+            % (failed_features, monitoring['fail_fast']), fg='red', bold=True)
+        service.purge_task_queue(image_id)
+        run_echo(monitoring, 'Purged the task queue')
+        terminated = service.terminate_workers(image_id)
+        run_echo(monitoring, 'Terminated %d workers' % len(terminated or []))
+
+        # Download whatever was uploaded before the workers were terminated
+        for filename in service.download_results(image_id):
+            aggregator.add_result(filename)
+        monitoring['aborted'] = True
+
+
+def finish_monitoring(monitoring):
+    """Wait for the remaining results of a run to be parsed and record the run in the history
+
+    Args:
+        monitoring (dict): state of the monitoring as returned by start_monitoring()
+
+    Returns:
+        dict: results in the same format as Beekeeper.summarize_results()
+    """
+
+    aggregator = monitoring['aggregator']
+    aggregator.finish()
+    results = aggregator.get_results()
+    monitoring['service'].record_history(monitoring['image_id'], results)
+    return results
+
+
+def get_max_failures(fail_fast, total_tasks):
+    """Convert a fail-fast threshold into a number of failed feature files
+
+    Args:
+        fail_fast (str): either a number i.e. 5 or a percentage of all feature files i.e. 10%
+        total_tasks (int): number of feature files in the run
+
+    Returns:
+        int: number of failed feature files at which to abort the run or None if fail-fast is disabled
+    """
+
+    if not fail_fast:
+        return None
+
+    try:
+        if fail_fast.endswith('%'):
+            return max(1, int(math.ceil(total_tasks * float(fail_fast[:-1]) / 100)))
+        return max(1, int(fail_fast))
+    except ValueError:
+        raise click.BadParameter('%s is not a number or a percentage' % fail_fast, param_hint='--fail-fast')
+
+
+def get_eta(service, image_id, manifest, estimates, requested_workers, slots=None):
+    """Estimate when a run will finish from the tasks without a result and the number of active workers
+
+    Args:
+        service (object): aws.AWS object
+        image_id (str): image_id of a Beekeeper run
+        manifest (list): of tasks in queue order, each a list of feature names
+        estimates (dict): feature name to estimated duration in seconds
+        requested_workers (int): number of workers requested for the run
+        slots (int): number of Behat processes per worker
+
+    Returns:
+        dict: remaining work, seconds until the run is finished and the number of workers used for the estimate
+    """
+
+    workers = service.count_active_workers(image_id)
+    finished = service.get_finished_features(image_id)
+    startup = 0.0
+
+    # Until the first worker is running, assume the requested workers once they have booted
+    if not workers:
+        workers = int(requested_workers or service.max_workers)
+        startup = service.get_startup_times()['boot']
+
+    slots = int(slots or service.slots_per_worker)
+    speedup = service.get_slot_speedup(service.get_worker_instance_type(), slots)
+    work, seconds = scheduler.estimate_remaining(manifest, estimates, finished, workers, slots, speedup)
+    return {'work': work, 'seconds': startup + seconds, 'workers': workers}
+
+
+def show_progress(remaining_tasks, totals, eta=None):
+    """Overwrite the progress line with the number of remaining tests, the running totals and the ETA if known"""
+    line = 'Number of tests remaining: %d   Scenarios: %d passed, %d failed   Steps: %d passed, %d failed, %d skipped' % (
+        remaining_tasks, totals['scenarios']['passed'], totals['scenarios']['failed'],
+        totals['steps']['passed'], totals['steps']['failed'], totals['steps']['skipped'])
+    if eta:
+        finish = datetime.datetime.now() + datetime.timedelta(seconds=eta['seconds'])
+        line += '   ETA: %s (%.1f minutes, %d workers)' % (finish.strftime('%H:%M'), eta['seconds'] / 60, eta['workers'])
+    click.echo('\r' + line + '   ', nl=False)
+
+
 @cli.command()
 @click.argument('image_id', required=False, default=None)
+@click.option('--profile', default='default', help='Beekeeper profile the run was started with')
 @click.option('--only_failed', default=False, is_flag=True, help='Show only failed scenarios')
-def report(image_id, only_failed):
+@click.pass_context
+def report(ctx, image_id, profile, only_failed):
     """Generate Behat result summary """
-    service = aws.AWS()
+    service = get_service(ctx, profile)
 
     # If no image_id provided then display a list of available images from the result folder
     if not image_id:
@@ -337,6 +1583,18 @@ def report(image_id, only_failed):
 
     # Generate the results for the given image_id
     results = service.summarize_results(image_id)
+    display_results(results, only_failed, service.max_receive_count)
+    display_boot_latencies(service.get_boot_latencies(image_id))
+
+
+def display_results(results, only_failed=False, max_receive_count=None):
+    """Display a summary of Behat results
+
+    Args:
+        results (dict): results as returned by Beekeeper.summarize_results()
+        only_failed (bool): show only feature files with failed scenarios
+        max_receive_count (str): number of attempts before a task was dead-lettered
+    """
 
     if results:
         header_fmt = '{0:35} {1:>9} {2:>5} {3:>5} {4:>7} {5:>5} {6:>5} {7:>5}'
@@ -351,9 +1609,9 @@ def report(image_id, only_failed):
             if only_failed and values['scenarios']['failed'] == 0:
                 continue
 
-            # Format the detail line
+            # Format the detail line. Results copied from the result cache are marked as such
             detail_line = line_fmt.format(
-                feature_file,
+                feature_file + ' (cached)' if feature_file in results.get('cached', []) else feature_file,
                 values['scenarios']['total'],
                 values['scenarios']['passed'],
                 values['scenarios']['failed'],
@@ -386,15 +1644,148 @@ def report(image_id, only_failed):
         )
         click.echo(detail_line)
         click.echo('\nNumber of feature files: %d' % counter)
+
+        # List the tasks which never produced a result separately
+        if results['dead_letters']:
+            click.secho('\nDead-lettered feature files (failed to complete after %s attempts):'
+                % max_receive_count, fg='red', bold=True)
+            for feature_name in results['dead_letters']:
+                click.secho('    %s' % feature_name, fg='red', bold=True)
+            click.echo('\nNumber of dead-lettered feature files: %d' % len(results['dead_letters']))
+
+        if results.get('cached'):
+            click.echo('Number of feature files skipped because they passed before with the same inputs: %d'
+                % len(results['cached']))
+
+        if results['interruptions']:
+            click.secho('\nNumber of interrupted and replaced workers: %d' % results['interruptions'], fg='yellow')
+        if results.get('capacity_moves'):
+            click.echo('Number of spot requests moved to another region for lack of capacity: %d'
+                % results['capacity_moves'])
     else:
         click.echo('No results found')
 
+
+def display_boot_latencies(latencies):
+    """Display the time each worker took from its launch to its first result
+
+    Args:
+        latencies (list): of entries as returned by Beekeeper.get_boot_latencies()
+    """
+
+    if not latencies:
+        return
+
+    latencies = sorted(latencies, key=lambda entry: entry['latency'])
+    seconds = [entry['latency'] for entry in latencies]
+    click.echo('\nBoot to first result: fastest %ds, median %ds, slowest %ds over %d workers'
+        % (seconds[0], seconds[len(seconds) // 2], seconds[-1], len(seconds)))
+    for entry in latencies:
+        click.echo('    {0:20} {1:6d}s'.format(entry['instance_id'], int(entry['latency'])))
+
+
+@cli.group()
+def history():
+    """Query the results of previous runs"""
+
+
+@history.command()
+@click.option('--profile', default='default', help='Beekeeper profile whose result folder to query')
+@click.option('--runs', default=20, help='Number of most recent runs to consider')
+@click.option('--limit', default=20, help='Number of feature files to show')
+@click.pass_context
+def slowest(ctx, profile, runs, limit):
+    """Show the feature files with the longest average duration"""
+    service = get_service(ctx, profile)
+    service.index_runs()
+
+    header_fmt = '{0:35} {1:>12} {2:>12} {3:>5}'
+    line_fmt = '{0:35} {1:12.1f} {2:12.1f} {3:5d}'
+    click.echo()
+    click.echo(header_fmt.format('Feature Name', 'Average (s)', 'Longest (s)', 'Runs'))
+    click.echo(header_fmt.format('------------', '-----------', '-----------', '----'))
+    for feature, average, longest, count in service.get_history().get_slowest(runs, limit):
+        click.echo(line_fmt.format(feature, average, longest, count))
+
+
+@history.command()
+@click.argument('feature')
+@click.option('--profile', default='default', help='Beekeeper profile whose result folder to query')
+@click.option('--runs', default=20, help='Number of most recent runs to show')
+@click.pass_context
+def trend(ctx, feature, profile, runs):
+    """Show the duration of a feature file over the most recent runs"""
+    service = get_service(ctx, profile)
+    service.index_runs()
+
+    # Accept the name of the feature file as well i.e. login.feature
+    feature = feature.split('.feature')[0]
+
+    header_fmt = '{0:16} {1:24} {2:7} {3:>12}'
+    line_fmt = '{0:16} {1:24} {2:7} {3:>12}'
+    click.echo()
+    click.echo(header_fmt.format('Image ID', 'Created', 'Status', 'Duration (s)'))
+    click.echo(header_fmt.format('--------', '-------', '------', '------------'))
+    for image_id, created, status, duration in service.get_history().get_trend(feature, runs):
+        line = line_fmt.format(image_id, time.ctime(created), status, '%.1f' % duration if duration else '-')
+        if status == 'passed':
+            click.echo(line)
+        else:
+            click.secho(line, fg='red', bold=True)
+
+
+@history.command()
+@click.option('--profile', default='default', help='Beekeeper profile whose result folder to query')
+@click.option('--runs', default=20, help='Number of most recent runs to consider')
+@click.option('--limit', default=20, help='Number of feature files to show')
+@click.pass_context
+def flaky(ctx, profile, runs, limit):
+    """Show the feature files which flip between passing and failing"""
+    service = get_service(ctx, profile)
+    service.index_runs()
+
+    header_fmt = '{0:35} {1:>5} {2:>6} {3:>6}'
+    line_fmt = '{0:35} {1:5d} {2:6d} {3:6d}'
+    click.echo()
+    click.echo(header_fmt.format('Feature Name', 'Flips', 'Passed', 'Failed'))
+    click.echo(header_fmt.format('------------', '-----', '------', '------'))
+    for feature, flips, passed, failed in service.get_history().get_flaky(runs, limit):
+        click.echo(line_fmt.format(feature, flips, passed, failed))
+
+
+@history.command()
+@click.argument('image_id')
+@click.argument('other_image_id')
+@click.option('--profile', default='default', help='Beekeeper profile whose result folder to query')
+@click.option('--duration-change', 'duration_change', default=25,
+    help='Percentage by which the duration of a feature file must change to be listed')
+@click.pass_context
+def diff(ctx, image_id, other_image_id, profile, duration_change):
+    """Compare the feature files of two runs"""
+    service = get_service(ctx, profile)
+    service.index_runs()
+
+    header_fmt = '{0:35} {1:>7} {2:>7} {3:>10} {4:>10}'
+    click.echo()
+    click.echo(header_fmt.format('Feature Name', 'Before', 'After', 'Before (s)', 'After (s)'))
+    click.echo(header_fmt.format('------------', '------', '-----', '----------', '---------'))
+    for feature, status, other_status, duration, other_duration in service.get_history().get_diff(
+            image_id, other_image_id, duration_change / 100.0):
+        line = header_fmt.format(feature, status or '-', other_status or '-',
+            '%.1f' % duration if duration else '-', '%.1f' % other_duration if other_duration else '-')
+        if other_status in ('failed', 'dead'):
+            click.secho(line, fg='red', bold=True)
+        else:
+            click.echo(line)
+
+
 @cli.command()
 @click.argument('profile', default='default')
 @click.option('--image_id', default=None, help='AWS AMI image ID')
-def cleanup(profile, image_id):
+@click.pass_context
+def cleanup(ctx, profile, image_id):
     """Delete old snapshots and queues."""
-    service = aws.AWS(profile)
+    service = get_service(ctx, profile)
     service.cleanup(image_id)
 
 
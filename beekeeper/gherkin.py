@@ -0,0 +1,118 @@
+import re
+
+# Keywords which begin a step line in a feature file
+step_keywords = ('Given', 'When', 'Then', 'And', 'But', '*')
+
+
+def parse_feature(text):
+    """Parse the text of a Behat feature file into the tags and steps it uses
+
+    Args:
+        text (str): content of a feature file
+
+    Returns:
+        dict: tags (set) found at feature and scenario level and steps (list) without their keyword
+    """
+
+    result = {
+        'tags': set(),
+        'steps': []
+    }
+
+    in_pystring = False
+    for line in text.splitlines():
+        line = line.strip()
+
+        # Skip multi-line string arguments i.e. text between a pair of """
+        if line.startswith('"""'):
+            in_pystring = not in_pystring
+            continue
+        if in_pystring or not line or line.startswith('#') or line.startswith('|'):
+            continue
+
+        if line.startswith('@'):
+            result['tags'].update(re.findall(r'@([^\s@]+)', line))
+            continue
+
+        keyword = line.split(' ', 1)[0]
+        if keyword in step_keywords and ' ' in line:
+            result['steps'].append(line.split(' ', 1)[1].strip())
+
+    return result
+
+
+def analyze_feature(text):
+    """Count the work in a Behat feature file as Behat will execute it
+
+    Scenario Outlines are expanded into one scenario per example row and Background steps are counted once for every
+    scenario they run before.
+
+    Args:
+        text (str): content of a feature file
+
+    Returns:
+        dict: number of scenarios, steps and scenarios tagged @javascript, plus the tags (list) used anywhere in the file
+    """
+
+    stats = {'scenarios': 0, 'steps': 0, 'javascript': 0}
+    tags = set()
+    feature_tags = set()
+    background_steps = 0
+    pending_tags = set()
+    section = None          # one of feature, background, scenario or examples
+    scenario = None
+
+    def finish_scenario():
+        # Add the executed instances of the current scenario to the totals
+        if scenario is None:
+            return
+        instances = scenario['rows'] if scenario['outline'] else [scenario['tags']]
+        for tags in instances:
+            stats['scenarios'] += 1
+            stats['steps'] += background_steps + scenario['steps']
+            if 'javascript' in feature_tags.union(tags):
+                stats['javascript'] += 1
+
+    in_pystring = False
+    header_seen = False
+    for line in text.splitlines():
+        line = line.strip()
+
+        if line.startswith('"""'):
+            in_pystring = not in_pystring
+            continue
+        if in_pystring or not line or line.startswith('#'):
+            continue
+
+        if line.startswith('@'):
+            pending_tags.update(re.findall(r'@([^\s@]+)', line))
+            tags.update(pending_tags)
+            continue
+
+        keyword = line.split(':', 1)[0].strip() if ':' in line else None
+        if keyword == 'Feature':
+            feature_tags, pending_tags, section = pending_tags, set(), 'feature'
+        elif keyword == 'Background':
+            section = 'background'
+        elif keyword in ('Scenario', 'Scenario Outline', 'Scenario Template'):
+            finish_scenario()
+            scenario = {'tags': pending_tags, 'steps': 0, 'outline': keyword != 'Scenario', 'rows': []}
+            pending_tags, section = set(), 'scenario'
+        elif keyword in ('Examples', 'Scenarios') and scenario is not None:
+            examples_tags = scenario['tags'].union(pending_tags)
+            pending_tags, section, header_seen = set(), 'examples', False
+        elif line.startswith('|'):
+            # Every row of an examples table except its header is a scenario
+            if section == 'examples':
+                if header_seen:
+                    scenario['rows'].append(examples_tags)
+                header_seen = True
+        elif line.split(' ', 1)[0] in step_keywords:
+            if section == 'background':
+                background_steps += 1
+            elif section == 'scenario':
+                scenario['steps'] += 1
+    finish_scenario()
+
+    stats['tags'] = sorted(tags)
+    return stats
@@ -0,0 +1,403 @@
+import sqlite3
+
+schema = '''
+    CREATE TABLE IF NOT EXISTS runs (
+        image_id TEXT PRIMARY KEY,
+        profile TEXT,
+        created REAL,
+        features INTEGER,
+        scenarios_passed INTEGER,
+        scenarios_failed INTEGER,
+        dead_letters INTEGER,
+        duration REAL
+    );
+    CREATE INDEX IF NOT EXISTS runs_created ON runs (created);
+
+    CREATE TABLE IF NOT EXISTS features (
+        image_id TEXT,
+        feature TEXT,
+        status TEXT,
+        scenarios_total INTEGER,
+        scenarios_passed INTEGER,
+        scenarios_failed INTEGER,
+        steps_total INTEGER,
+        steps_passed INTEGER,
+        steps_failed INTEGER,
+        steps_skipped INTEGER,
+        duration REAL,
+        PRIMARY KEY (image_id, feature)
+    );
+    CREATE INDEX IF NOT EXISTS features_feature ON features (feature);
+
+    CREATE TABLE IF NOT EXISTS analysis (
+        image_id TEXT,
+        feature TEXT,
+        scenarios INTEGER,
+        steps INTEGER,
+        javascript INTEGER,
+        PRIMARY KEY (image_id, feature)
+    );
+
+    CREATE TABLE IF NOT EXISTS latest (
+        feature TEXT PRIMARY KEY,
+        image_id TEXT,
+        created REAL,
+        duration REAL
+    );
+
+    CREATE TABLE IF NOT EXISTS benchmarks (
+        run_id TEXT PRIMARY KEY,
+        instance_type TEXT,
+        slots INTEGER,
+        created REAL,
+        features INTEGER,
+        completed INTEGER,
+        work REAL,
+        throughput REAL,
+        boot REAL,
+        price REAL
+    );
+    CREATE INDEX IF NOT EXISTS benchmarks_instance_type ON benchmarks (instance_type, slots, created);
+
+    CREATE TABLE IF NOT EXISTS cache (
+        feature TEXT,
+        feature_hash TEXT,
+        fingerprint TEXT,
+        revision TEXT,
+        image_id TEXT,
+        created REAL,
+        result BLOB,
+        PRIMARY KEY (feature, feature_hash, fingerprint)
+    );
+    CREATE INDEX IF NOT EXISTS cache_created ON cache (created);
+'''
+
+
+class History(object):
+    """Index of the results of all Beekeeper runs in a result folder
+
+    The index is a SQLite database named .history.sqlite in the result folder. Each run is recorded once it has been
+    summarized so questions across runs are answered without parsing any result files. Benchmark runs are kept apart
+    from test runs in a table of their own, and the passing results of feature files are kept in a result cache.
+    """
+
+    def __init__(self, behat_result_folder):
+        self.path = behat_result_folder + '/.history.sqlite'
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(schema)
+
+    def record_run(self, image_id, profile, created, results):
+        """Record the results of a run, replacing what was recorded for it before
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            profile (str): Beekeeper profile of the run
+            created (float): creation time of the run as a timestamp
+            results (dict): results as returned by Beekeeper.summarize_results() or None if there are none yet
+        """
+
+        details = results['details'] if results else []
+        dead_letters = results['dead_letters'] if results else []
+
+        rows = []
+        for feature, values in details:
+            status = 'failed' if values['scenarios']['failed'] or values['steps']['failed'] else 'passed'
+            rows.append((image_id, feature, status,
+                values['scenarios']['total'], values['scenarios']['passed'], values['scenarios']['failed'],
+                values['steps']['total'], values['steps']['passed'], values['steps']['failed'],
+                values['steps']['skipped'], values.get('duration')))
+        for feature in dead_letters:
+            rows.append((image_id, feature, 'dead', 0, 0, 0, 0, 0, 0, 0, None))
+
+        with self.connection:
+            self.connection.execute('DELETE FROM features WHERE image_id = ?', (image_id,))
+            self.connection.executemany('INSERT INTO features VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.connection.execute('INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (
+                image_id, profile, created, len(rows),
+                sum([values['scenarios']['passed'] for feature, values in details]),
+                sum([values['scenarios']['failed'] for feature, values in details]),
+                len(dead_letters),
+                sum([values.get('duration') or 0.0 for feature, values in details])
+            ))
+
+            # Keep the most recent duration of every feature file at hand for estimating the next run
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO latest SELECT ?, ?, ?, ? '
+                'WHERE NOT EXISTS (SELECT 1 FROM latest WHERE feature = ? AND created > ?)',
+                [(row[1], image_id, created, row[10], row[1], created) for row in rows if row[10] is not None])
+
+    def record_analysis(self, image_id, analysis):
+        """Record the static analysis of the feature files of a run, replacing what was recorded for it before
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            analysis (dict): feature file name i.e. login.feature to its analysis
+        """
+
+        with self.connection:
+            self.connection.execute('DELETE FROM analysis WHERE image_id = ?', (image_id,))
+            self.connection.executemany('INSERT INTO analysis VALUES (?, ?, ?, ?, ?)',
+                [(image_id, name.split('.feature')[0], stats['scenarios'], stats['steps'], stats['javascript'])
+                    for name, stats in analysis.items()])
+
+    def get_analyzed_runs(self):
+        """Get the runs whose static analysis is recorded
+
+        Returns:
+            set: of image_ids
+        """
+        return set([row[0] for row in self.connection.execute('SELECT DISTINCT image_id FROM analysis')])
+
+    def get_latest_analysis(self):
+        """Get the static analysis recorded for the most recent run which has one
+
+        Returns:
+            dict: feature file name i.e. login.feature to its analysis. Empty if no run has an analysis
+        """
+
+        rows = self.connection.execute(
+            'SELECT feature, scenarios, steps, javascript FROM analysis WHERE image_id = ('
+            'SELECT analysis.image_id FROM analysis JOIN runs ON runs.image_id = analysis.image_id '
+            'ORDER BY runs.created DESC LIMIT 1)')
+        return dict([(feature + '.feature', {'scenarios': scenarios, 'steps': steps, 'javascript': javascript})
+            for feature, scenarios, steps, javascript in rows])
+
+    def get_calibration_samples(self):
+        """Get the static analysis and measured duration of every feature file result for calibrating the cost model
+
+        Returns:
+            list: of (analysis, duration) tuples
+        """
+
+        rows = self.connection.execute(
+            'SELECT analysis.scenarios, analysis.steps, analysis.javascript, features.duration FROM features '
+            'JOIN analysis ON analysis.image_id = features.image_id AND analysis.feature = features.feature '
+            'WHERE features.duration IS NOT NULL')
+        return [({'scenarios': scenarios, 'steps': steps, 'javascript': javascript}, duration)
+            for scenarios, steps, javascript, duration in rows]
+
+    def get_runs(self):
+        """Get the recorded runs
+
+        Returns:
+            list: of (image_id, created) tuples, most recent first
+        """
+        return self.connection.execute('SELECT image_id, created FROM runs ORDER BY created DESC').fetchall()
+
+    def get_durations(self, image_id=None):
+        """Get the duration of each feature file, from its most recent run unless a run is given
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+
+        Returns:
+            dict: feature name to duration in seconds
+        """
+
+        if image_id:
+            rows = self.connection.execute(
+                'SELECT feature, duration FROM features WHERE image_id = ? AND duration IS NOT NULL', (image_id,))
+        else:
+            rows = self.connection.execute('SELECT feature, duration FROM latest')
+        return dict(rows.fetchall())
+
+    def get_slowest(self, runs=20, limit=20):
+        """Get the feature files with the longest average duration over the most recent runs
+
+        Args:
+            runs (int): number of most recent runs to consider
+            limit (int): number of feature files to return
+
+        Returns:
+            list: of (feature, average duration, longest duration, number of runs) tuples
+        """
+
+        return self.connection.execute(
+            'SELECT feature, AVG(duration), MAX(duration), COUNT(*) FROM features '
+            'WHERE image_id IN (SELECT image_id FROM runs ORDER BY created DESC LIMIT ?) AND duration IS NOT NULL '
+            'GROUP BY feature ORDER BY AVG(duration) DESC LIMIT ?', (runs, limit)).fetchall()
+
+    def get_trend(self, feature, runs=20):
+        """Get the duration and status of a feature file in the most recent runs it was part of
+
+        Args:
+            feature (str): feature name i.e. login
+            runs (int): number of runs to return
+
+        Returns:
+            list: of (image_id, created, status, duration) tuples, oldest first
+        """
+
+        rows = self.connection.execute(
+            'SELECT image_id, created, status, features.duration FROM features JOIN runs USING (image_id) '
+            'WHERE feature = ? ORDER BY created DESC LIMIT ?', (feature, runs)).fetchall()
+        return list(reversed(rows))
+
+    def get_flaky(self, runs=20, limit=20):
+        """Get the feature files which flip between passing and failing over the most recent runs
+
+        Args:
+            runs (int): number of most recent runs to consider
+            limit (int): number of feature files to return
+
+        Returns:
+            list: of (feature, flips, passed, failed) tuples with the most flips first
+        """
+
+        rows = self.connection.execute(
+            'SELECT feature, status FROM features JOIN runs USING (image_id) '
+            'WHERE image_id IN (SELECT image_id FROM runs ORDER BY created DESC LIMIT ?) AND status != ? '
+            'ORDER BY feature, created', (runs, 'dead'))
+
+        flaky = {}
+        previous = (None, None)
+        for feature, status in rows:
+            counts = flaky.setdefault(feature, {'flips': 0, 'passed': 0, 'failed': 0})
+            counts[status] += 1
+            if previous[0] == feature and previous[1] != status:
+                counts['flips'] += 1
+            previous = (feature, status)
+
+        results = [(feature, counts['flips'], counts['passed'], counts['failed'])
+            for feature, counts in flaky.items() if counts['flips']]
+        return sorted(results, key=lambda result: (-result[1], result[0]))[:limit]
+
+    def get_diff(self, image_id, other_image_id, duration_change=0.25):
+        """Compare the feature files of two runs
+
+        Args:
+            image_id (str): image_id of the earlier run
+            other_image_id (str): image_id of the later run
+            duration_change (float): relative change in duration i.e. 0.25 for 25% from which a feature file is listed
+
+        Returns:
+            list: of (feature, status, other status, duration, other duration) tuples for feature files whose status
+                  or duration changed or which are only part of one of the runs. A missing status is None
+        """
+
+        query = 'SELECT feature, status, duration FROM features WHERE image_id = ?'
+        before = dict([(row[0], row[1:]) for row in self.connection.execute(query, (image_id,))])
+        after = dict([(row[0], row[1:]) for row in self.connection.execute(query, (other_image_id,))])
+
+        diff = []
+        for feature in sorted(set(before).union(after)):
+            status, duration = before.get(feature, (None, None))
+            other_status, other_duration = after.get(feature, (None, None))
+            slower_or_faster = duration and other_duration and abs(other_duration - duration) >= duration * duration_change
+            if status != other_status or slower_or_faster:
+                diff.append((feature, status, other_status, duration, other_duration))
+        return diff
+
+    def record_benchmark(self, run_id, instance_type, slots, created, measurement):
+        """Record the measurement of a benchmark run
+
+        Args:
+            run_id (str): id of the benchmark run i.e. ami-1234abcd-m4.large-2
+            instance_type (str): instance type of the worker
+            slots (int): number of Behat processes the worker ran at once
+            created (float): start time of the benchmark as a timestamp
+            measurement (dict): features, completed, work, throughput, boot and price of the run
+        """
+
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO benchmarks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                run_id, instance_type, slots, created, measurement['features'], measurement['completed'],
+                measurement['work'], measurement['throughput'], measurement['boot'], measurement['price']))
+
+    def get_benchmark(self, instance_type, slots):
+        """Get the most recent complete benchmark of an instance type and number of slots
+
+        Args:
+            instance_type (str): instance type i.e. m4.large
+            slots (int): number of Behat processes per worker
+
+        Returns:
+            dict: the recorded measurement or None if it was never benchmarked
+        """
+
+        row = self.connection.execute(
+            'SELECT features, completed, work, throughput, boot, price FROM benchmarks '
+            'WHERE instance_type = ? AND slots = ? AND completed = features ORDER BY created DESC LIMIT 1',
+            (instance_type, slots)).fetchone()
+        if not row:
+            return None
+        return dict(zip(['features', 'completed', 'work', 'throughput', 'boot', 'price'], row))
+
+    def get_speedup(self, instance_type, slots):
+        """Get how much faster a worker gets through feature files with several slots than with one
+
+        Args:
+            instance_type (str): instance type i.e. m4.large
+            slots (int): number of Behat processes per worker
+
+        Returns:
+            float: measured throughput with the slots divided by the throughput with one slot, or None if either was
+                   never benchmarked
+        """
+
+        single = self.get_benchmark(instance_type, 1)
+        multiple = self.get_benchmark(instance_type, slots)
+        if not single or not multiple or not single['throughput']:
+            return None
+        return multiple['throughput'] / single['throughput']
+
+    def record_passes(self, image_id, created, fingerprint, revision, passes):
+        """Cache the results of the feature files which passed in a run
+
+        Args:
+            image_id (str): image_id of a Beekeeper run
+            created (float): creation time of the run as a timestamp
+            fingerprint (str): fingerprint of the master instance the run tested
+            revision (str): git commit the run tested or None if the git repository had uncommitted changes
+            passes (list): of (feature, content hash, result file content) tuples
+        """
+
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(feature, feature_hash, fingerprint, revision, image_id, created, sqlite3.Binary(result))
+                    for feature, feature_hash, result in passes])
+
+    def get_passes(self, hashes, since):
+        """Get the cached passes of feature files with the given content
+
+        Args:
+            hashes (dict): feature name to the content hash of the feature file
+            since (float): timestamp before which cached passes have expired
+
+        Returns:
+            dict: feature name to a list of (fingerprint, revision, image_id) tuples, most recent first
+        """
+
+        passes = {}
+        rows = self.connection.execute(
+            'SELECT feature, feature_hash, fingerprint, revision, image_id FROM cache WHERE created >= ? '
+            'ORDER BY created DESC', (since,))
+        for feature, feature_hash, fingerprint, revision, image_id in rows:
+            if hashes.get(feature) == feature_hash:
+                passes.setdefault(feature, []).append((fingerprint, revision, image_id))
+        return passes
+
+    def get_cached_result(self, feature, image_id):
+        """Get the content of a cached result file
+
+        Args:
+            feature (str): feature name i.e. login.feature
+            image_id (str): image_id of the run the feature file passed in
+
+        Returns:
+            str: content of the result file or None if it is not cached
+        """
+
+        row = self.connection.execute('SELECT result FROM cache WHERE feature = ? AND image_id = ?',
+            (feature, image_id)).fetchone()
+        return str(row[0]) if row else None
+
+    def expire_passes(self, before):
+        """Remove the cached passes made before a point in time
+
+        Args:
+            before (float): timestamp
+        """
+
+        with self.connection:
+            self.connection.execute('DELETE FROM cache WHERE created < ?', (before,))
@@ -0,0 +1,166 @@
+import os
+import re
+import gherkin
+
+# Behat hooks which can be limited to scenarios or features with certain tags
+hook_keywords = ('BeforeScenario', 'AfterScenario', 'BeforeFeature', 'AfterFeature', 'BeforeStep', 'AfterStep',
+    'BeforeSuite', 'AfterSuite')
+
+
+def step_pattern_to_regex(pattern):
+    """Convert a Behat step definition pattern into a compiled regular expression
+
+    Args:
+        pattern (str): either a regex pattern i.e. /^I am on "([^"]*)"$/ or a turnip pattern i.e. I am on :page
+
+    Returns:
+        object: compiled regular expression or None if the pattern cannot be converted
+    """
+
+    try:
+        # Regex patterns are enclosed in slashes with optional modifiers after the closing slash
+        if pattern.startswith('/') and pattern.rfind('/') > 0:
+            end = pattern.rfind('/')
+            flags = re.IGNORECASE if 'i' in pattern[end + 1:] else 0
+            return re.compile(pattern[1:end], flags)
+
+        # Turnip patterns use :placeholders, (optional) text and alternative/words
+        tokens = re.split(r'(:[A-Za-z_]\w*|\([^()]*\)|[^\s/()]+(?:/[^\s/()]+)+)', pattern)
+        regex = ''
+        for index, token in enumerate(tokens):
+            if index % 2 == 0:
+                regex += re.escape(token)
+            elif token.startswith(':'):
+                regex += r'(?:"[^"]*"|\'[^\']*\'|[\w.,-]+)'
+            elif token.startswith('('):
+                regex += '(?:%s)?' % re.escape(token[1:-1])
+            else:
+                regex += '(?:%s)' % '|'.join([re.escape(word) for word in token.split('/')])
+        return re.compile('^%s$' % regex)
+
+    except re.error:
+        return None
+
+
+def parse_step_definitions(source):
+    """Get the step patterns and hook tags defined in a Behat context file
+
+    Args:
+        source (str): content of a PHP context file
+
+    Returns:
+        dict: patterns (list) of compiled step regexes and tags (set) used by hooks, or None when the file contains a
+              definition which could affect every feature i.e. an untagged hook or a pattern that cannot be converted
+    """
+
+    result = {
+        'patterns': [],
+        'tags': set()
+    }
+
+    # Step definitions declared in docblock annotations i.e. @Given /^I am on "([^"]*)"$/
+    definitions = re.findall(r'@(?:Given|When|Then)\s+(.+?)\s*$', source, re.MULTILINE)
+
+    # Step definitions declared as PHP 8 attributes i.e. #[Given('I am on :page')]
+    definitions += [match[1] for match in re.findall(r'#\[(?:Given|When|Then)\(\s*([\'"])(.+?)\1\s*\)\]', source)]
+
+    for definition in definitions:
+        regex = step_pattern_to_regex(definition)
+        if regex is None:
+            return None
+        result['patterns'].append(regex)
+
+    # Hooks only affect features with the given tags. A hook without tags or with a negated tag affects everything
+    for keyword, tag_filter in re.findall(r'@(%s)\b(.*)$' % '|'.join(hook_keywords), source, re.MULTILINE):
+        tags = re.findall(r'@(\w+)', tag_filter)
+        if keyword in ('BeforeSuite', 'AfterSuite') or not tags or '~' in tag_filter:
+            return None
+        result['tags'].update(tags)
+
+    return result
+
+
+def select_features(changed_files, feature_sources, other_sources, previous_sources=None):
+    """Select the feature files impacted by a set of changed files
+
+    Args:
+        changed_files (list): full paths of files changed on the master instance
+        feature_sources (dict): full path to content of every feature file
+        other_sources (dict): full path to content of the changed files which are not feature files
+        previous_sources (dict): full path to content of the changed files which are not feature files as they were
+                                 before the change. Files which did not exist before are left out
+
+    Returns:
+        set: names of impacted feature files or None if the impact cannot be determined and a full run is required
+    """
+
+    # Index every feature file by the steps and tags it uses
+    features = {}
+    tagged = {}
+    for path, text in feature_sources.items():
+        name = os.path.basename(path)
+        features[name] = gherkin.parse_feature(text)
+        for tag in features[name]['tags']:
+            tagged.setdefault(tag.lower(), set()).add(name)
+
+    previous_sources = previous_sources or {}
+    selected = set()
+    for path in changed_files:
+        # A changed feature file impacts itself. Deleted feature files are ignored
+        if path.endswith('.feature'):
+            if os.path.basename(path) in features:
+                selected.add(os.path.basename(path))
+            continue
+
+        # A changed context file impacts every feature using one of its steps or tagged for one of its hooks. The
+        # definitions before the change count too, so features using a removed or renamed step are selected
+        sources = [source for source in (other_sources.get(path), previous_sources.get(path)) if source]
+        if any(re.search(r'@(?:Given|When|Then|%s)\b|#\[(?:Given|When|Then)\(' % '|'.join(hook_keywords), source)
+                for source in sources):
+            for source in sources:
+                definitions = parse_step_definitions(source)
+                if definitions is None:
+                    return None
+
+                for name, feature in features.items():
+                    if any(regex.search(step) for regex in definitions['patterns'] for step in feature['steps']):
+                        selected.add(name)
+                for tag in definitions['tags']:
+                    selected.update(tagged.get(tag.lower(), set()))
+            continue
+
+        # Any other file impacts the features tagged after one of the folders in its path i.e. a change in
+        # modules/custom/checkout/checkout.module impacts features tagged @checkout
+        components = set(path.lower().split('/'))
+        components.add(os.path.splitext(os.path.basename(path))[0].lower())
+        matched = components.intersection(tagged.keys())
+        if not matched:
+            return None
+        for tag in matched:
+            selected.update(tagged[tag])
+
+    return selected
+
+
+def select_impacted_features(service, ssh, git_ref):
+    """Select the feature files impacted by changes on the master instance since a git reference
+
+    Args:
+        service (object): Beekeeper object
+        ssh (object): ssh connection to the master instance
+        git_ref (str): git reference i.e. branch, tag or commit to compare against
+
+    Returns:
+        set: names of impacted feature files or None if a full run is required
+    """
+
+    changed_files = service.get_changed_files(ssh, git_ref)
+    if changed_files is None:
+        return None
+
+    feature_sources = service.read_remote_files(ssh, service.find_remote_files(ssh, service.behat_project_folder, '*.feature'))
+    other_files = [path for path in changed_files if not path.endswith('.feature')]
+    other_sources = service.read_remote_files(ssh, other_files) if other_files else {}
+    previous_sources = service.read_remote_revisions(ssh, git_ref, other_files) if other_files else {}
+
+    return select_features(changed_files, feature_sources, other_sources, previous_sources)
@@ -0,0 +1,91 @@
+import datetime
+import json
+import os
+
+# Events which record the progress within a phase rather than the completion of one
+progress_events = ('first_result', 'eta', 'priority_finished')
+
+
+class Journal(object):
+    """Append-only journal of the resources and phases of a Beekeeper run
+
+    Every entry is written as a line of JSON to journal.log in the result folder of the run and flushed to disk straight
+    away so a run can be resumed after the Beekeeper process died.
+    """
+
+    def __init__(self, behat_result_folder, image_id):
+        self.folder = behat_result_folder + '/' + image_id
+        self.path = self.folder + '/journal.log'
+
+    def exists(self):
+        """Check if the run has a journal"""
+        return os.path.isfile(self.path)
+
+    def record(self, event, **data):
+        """Append an entry to the journal
+
+        Args:
+            event (str): name of the phase or resource i.e. task_queue_created
+            **data: values to record with the event i.e. the queue URL
+        """
+
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+
+        entry = dict(data)
+        entry['event'] = event
+        entry['time'] = datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self):
+        """Read all entries of the journal
+
+        Returns:
+            list: of entries in the order they were recorded
+        """
+
+        if not self.exists():
+            return []
+
+        entries = []
+        with open(self.path) as f:
+            for line in f:
+                # A partially written last line means the process died while writing it
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break
+        return entries
+
+    def get_state(self):
+        """Replay the journal into the current state of the run
+
+        Returns:
+            dict: latest value of every recorded key plus the set of recorded events and the last completed phase
+        """
+
+        state = {'events': set(), 'last_event': None}
+        for entry in self.read():
+            state['events'].add(entry['event'])
+            if entry['event'] not in progress_events:
+                state['last_event'] = entry['event']
+            for key, value in entry.items():
+                if key not in ('event', 'time'):
+                    state[key] = value
+        return state
+
+    def get_times(self):
+        """Get the time each event was first recorded
+
+        Returns:
+            dict: event name to datetime
+        """
+
+        times = {}
+        for entry in self.read():
+            if entry['event'] not in times:
+                times[entry['event']] = datetime.datetime.strptime(entry['time'], '%Y-%m-%d %H:%M:%S')
+        return times
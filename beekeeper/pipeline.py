@@ -0,0 +1,130 @@
+import os
+import threading
+import Queue
+
+
+class ResultAggregator(threading.Thread):
+    """Parse downloaded result files in a background thread and keep running totals of a Beekeeper run
+
+    The monitor thread only queues the names of downloaded files so parsing never slows down draining the S3 bucket.
+    """
+
+    def __init__(self, service, image_id):
+        super(ResultAggregator, self).__init__()
+        self.daemon = True
+
+        self.service = service
+        self.image_id = image_id
+        self.result_folder = service.behat_result_folder + '/' + image_id
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+
+        self.details = {}
+        self.dead_letters = []
+        self.totals = {
+            'scenarios': {'total': 0, 'passed': 0, 'failed': 0},
+            'steps': {'total': 0, 'passed': 0, 'failed': 0, 'skipped': 0},
+        }
+
+    def add_result(self, filename):
+        """Queue a downloaded result file for parsing
+
+        Args:
+            filename (str): name of a result file in the local result folder i.e. login.feature.result
+        """
+        self.queue.put(('result', filename))
+
+    def add_dead_letter(self, feature):
+        """Queue a feature file which was dead-lettered
+
+        Args:
+            feature (str): name of the feature file i.e. login.feature
+        """
+        self.queue.put(('dead', feature))
+
+    def finish(self):
+        """Wait until every queued file has been parsed and stop the thread"""
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            kind, name = item
+            if kind == 'result':
+                feature_name = name.split('.feature.result')[0]
+                parsed = self.service.parse_result_file(self.result_folder + '/' + name)
+            else:
+                feature_name = name.split('.feature')[0]
+
+            with self.lock:
+                if kind == 'dead':
+                    if feature_name not in self.dead_letters:
+                        self.dead_letters.append(feature_name)
+                    continue
+
+                # A late result replaces a dead letter for the same feature file
+                if feature_name in self.dead_letters:
+                    self.dead_letters.remove(feature_name)
+
+                # A feature file can only be counted once i.e. when monitoring is resumed
+                if feature_name in self.details:
+                    for stats_type in self.totals:
+                        for result_type in self.totals[stats_type]:
+                            self.totals[stats_type][result_type] -= self.details[feature_name][stats_type][result_type]
+                self.details[feature_name] = parsed
+                for stats_type in self.totals:
+                    for result_type in self.totals[stats_type]:
+                        self.totals[stats_type][result_type] += parsed[stats_type][result_type]
+
+    def get_totals(self):
+        """Get a copy of the running totals
+
+        Returns:
+            dict: scenario and step totals
+        """
+        with self.lock:
+            return dict([(stats_type, dict(values)) for stats_type, values in self.totals.items()])
+
+    def count_failed_features(self):
+        """Count the feature files parsed so far which have failed scenarios or were dead-lettered
+
+        Returns:
+            int: number of failed feature files
+        """
+        with self.lock:
+            failed = [name for name, values in self.details.items() if values['scenarios']['failed']]
+            return len(failed) + len(self.dead_letters)
+
+    def get_results(self):
+        """Get the results in the same format as Beekeeper.summarize_results()
+
+        Returns:
+            dict: details, totals and dead letters or None if nothing has been parsed
+        """
+        with self.lock:
+            if not self.details and not self.dead_letters:
+                return None
+
+            return {
+                'details': sorted(self.details.items()),
+                'totals': dict([(stats_type, dict(values)) for stats_type, values in self.totals.items()]),
+                'dead_letters': sorted(self.dead_letters),
+                'cached': sorted([name.split('.feature')[0] for name in self.service.get_cached_features(self.image_id)]),
+                'interruptions': len(self.service.get_interruptions(self.image_id)),
+                'capacity_moves': len(self.service.get_interruptions(self.image_id, 'capacity_move'))
+            }
+
+    def load_existing(self):
+        """Queue the result and dead-letter files already in the local result folder i.e. when monitoring is resumed"""
+        if not os.path.isdir(self.result_folder):
+            return
+
+        for filename in sorted(os.listdir(self.result_folder)):
+            if filename.endswith('.result'):
+                self.add_result(filename)
+            elif filename.endswith('.dead'):
+                self.add_dead_letter(filename.split('.dead')[0])
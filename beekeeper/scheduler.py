@@ -0,0 +1,339 @@
+import heapq
+
+# Time to snapshot the master instance, fulfill the spot requests and boot the workers. See FAQ.md
+default_startup_seconds = {'snapshot': 180.0, 'fulfillment': 60.0, 'boot': 60.0}
+
+
+class CostModel(object):
+    """Linear model which predicts the duration of a feature file from its static analysis
+
+    The duration in seconds is a fixed cost per feature file plus a cost per scenario, per step and per scenario tagged
+    @javascript. The coefficients start from rough defaults and are calibrated against the durations of previous runs.
+    """
+
+    terms = ['feature', 'scenarios', 'steps', 'javascript']
+    default_coefficients = {'feature': 5.0, 'scenarios': 1.0, 'steps': 2.0, 'javascript': 10.0}
+
+    # Weight of the default coefficients when calibrating so a handful of samples cannot produce a wild model
+    prior_weight = 10.0
+
+    def __init__(self, coefficients=None, samples=0):
+        self.coefficients = dict(coefficients or self.default_coefficients)
+        self.samples = samples
+
+    def features(self, stats):
+        """Get the values of the model terms for the static analysis of a feature file"""
+        return [1.0, float(stats['scenarios']), float(stats['steps']), float(stats['javascript'])]
+
+    def predict(self, stats):
+        """Predict the duration of a feature file
+
+        Args:
+            stats (dict): static analysis of a feature file as returned by gherkin.analyze_feature()
+
+        Returns:
+            float: duration in seconds
+        """
+        values = self.features(stats)
+        return sum([self.coefficients[term] * value for term, value in zip(self.terms, values)])
+
+    @classmethod
+    def calibrate(cls, samples):
+        """Fit the model to the measured durations of feature files using ridge regression towards the defaults
+
+        Args:
+            samples (list): of (stats, duration) tuples
+
+        Returns:
+            object: calibrated CostModel
+        """
+
+        if not samples:
+            return cls()
+
+        model = cls()
+        size = len(cls.terms)
+        prior = [cls.default_coefficients[term] for term in cls.terms]
+
+        # Solve (X'X + wI) b = X'y + w * prior
+        matrix = [[cls.prior_weight if row == column else 0.0 for column in range(size)] for row in range(size)]
+        vector = [cls.prior_weight * value for value in prior]
+        for stats, duration in samples:
+            values = model.features(stats)
+            for row in range(size):
+                vector[row] += values[row] * duration
+                for column in range(size):
+                    matrix[row][column] += values[row] * values[column]
+
+        solution = solve(matrix, vector)
+
+        # A negative cost makes no sense and only comes from noise
+        return cls(dict(zip(cls.terms, [max(0.0, value) for value in solution])), len(samples))
+
+
+def solve(matrix, vector):
+    """Solve a small system of linear equations using Gaussian elimination with partial pivoting"""
+
+    size = len(vector)
+    rows = [list(matrix[index]) + [vector[index]] for index in range(size)]
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda row: abs(rows[row][column]))
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for row in range(column + 1, size):
+            factor = rows[row][column] / rows[column][column]
+            for index in range(column, size + 1):
+                rows[row][index] -= factor * rows[column][index]
+
+    solution = [0.0] * size
+    for row in reversed(range(size)):
+        total = sum([rows[row][index] * solution[index] for index in range(row + 1, size)])
+        solution[row] = (rows[row][size] - total) / rows[row][row]
+    return solution
+
+
+def estimate_durations(features, history, analysis, model):
+    """Estimate how long each feature file takes to run
+
+    Args:
+        features (list): names of feature files
+        history (dict): feature name to the duration in seconds of its most recent run
+        analysis (dict): feature name to its static analysis as returned by gherkin.analyze_feature()
+        model (object): CostModel used for feature files without history
+
+    Returns:
+        dict: feature name to estimated duration in seconds
+    """
+
+    estimates = {}
+    for feature in features:
+        if feature in history:
+            estimates[feature] = history[feature]
+        elif feature in analysis:
+            estimates[feature] = model.predict(analysis[feature])
+        else:
+            estimates[feature] = model.coefficients['feature']
+    return estimates
+
+
+def simulate_makespan(durations, workers):
+    """Simulate workers pulling tasks from the queue in order and get the time until the last one finishes
+
+    Args:
+        durations (list): estimated duration of each task in queue order
+        workers (int): number of workers
+
+    Returns:
+        float: makespan in seconds
+    """
+
+    finish_times = [0.0] * max(1, workers)
+    for duration in durations:
+        heapq.heappush(finish_times, heapq.heappop(finish_times) + duration)
+    return max(finish_times)
+
+
+def pack_tasks(features, estimates, target):
+    """Group small feature files into tasks of up to a target duration using first-fit decreasing bin packing
+
+    Args:
+        features (list): names of feature files
+        estimates (dict): feature name to estimated duration in seconds
+        target (float): target duration of a task in seconds. Feature files longer than this run on their own. With a
+                        target of 0 every feature file is a task of its own
+
+    Returns:
+        list: of tasks, each a list of feature names, ordered from the longest to the shortest task
+    """
+
+    tasks = []
+    for feature in sorted(features, key=lambda name: estimates[name], reverse=True):
+        for task in tasks:
+            if target and task['duration'] + estimates[feature] <= target:
+                task['features'].append(feature)
+                task['duration'] += estimates[feature]
+                break
+        else:
+            tasks.append({'features': [feature], 'duration': estimates[feature]})
+
+    # Queue the longest tasks first so they do not end up as stragglers at the end of a run
+    tasks.sort(key=lambda task: task['duration'], reverse=True)
+    return [task['features'] for task in tasks]
+
+
+def slot_durations(durations, slots, speedup):
+    """Stretch task durations to the time they take when a worker runs several of them at once
+
+    Args:
+        durations (list): duration in seconds of each task when it runs alone on a worker
+        slots (int): number of Behat processes per worker
+        speedup (float): throughput of a worker with the slots relative to a worker with one slot
+
+    Returns:
+        list: duration in seconds of each task when it shares its worker with the other slots
+    """
+
+    if slots <= 1:
+        return list(durations)
+    return [duration * slots / speedup for duration in durations]
+
+
+def plan_workers(durations, startup, price, volume_size, storage_price, max_workers, slots=1, speedup=1.0):
+    """Simulate a run for every number of workers and get its runtime and cost
+
+    Args:
+        durations (list): estimated duration in seconds of each task in queue order
+        startup (dict): seconds to snapshot, fulfill the spot requests and boot the workers
+        price (float): spot price per instance hour
+        volume_size (float): EBS volume size of a worker in GB
+        storage_price (float): EBS storage price per GB-Month
+        max_workers (int): largest number of workers to simulate
+        slots (int): number of Behat processes per worker
+        speedup (float): throughput of a worker with the slots relative to a worker with one slot
+
+    Returns:
+        list: of dicts with the number of workers, runtime in seconds and cost in dollars
+    """
+
+    durations = slot_durations(durations, slots, speedup)
+    plan = []
+    for workers in range(1, max(1, max_workers) + 1):
+        work = simulate_makespan(durations, workers * slots)
+
+        # Workers are billed from the moment they boot until the last task is done
+        instance_hours = workers * (startup['boot'] + work) / 3600
+        cost = instance_hours * price + instance_hours * volume_size / 744 * storage_price
+
+        plan.append({
+            'workers': workers,
+            'runtime': startup['snapshot'] + startup['fulfillment'] + startup['boot'] + work,
+            'cost': cost
+        })
+    return plan
+
+
+def recommend_workers(plan, deadline=None, budget=None):
+    """Recommend a number of workers from a plan
+
+    Args:
+        plan (list): as returned by plan_workers()
+        deadline (float): latest acceptable runtime in seconds
+        budget (float): highest acceptable cost in dollars
+
+    Returns:
+        dict: the recommended plan entry or None if no number of workers meets the deadline and budget
+    """
+
+    candidates = [entry for entry in plan
+        if (deadline is None or entry['runtime'] <= deadline) and (budget is None or entry['cost'] <= budget)]
+    if not candidates:
+        return None
+
+    # The cheapest run which meets a deadline, otherwise the fastest run within the budget
+    if deadline is not None:
+        return min(candidates, key=lambda entry: (entry['cost'], entry['runtime']))
+    if budget is not None:
+        return min(candidates, key=lambda entry: (entry['runtime'], entry['cost']))
+
+    # Without a target, take the fewest workers which get within 10% of the fastest possible runtime
+    fastest = min([entry['runtime'] for entry in candidates])
+    return min([entry for entry in candidates if entry['runtime'] <= fastest * 1.1], key=lambda entry: entry['workers'])
+
+
+def estimate_remaining(tasks, estimates, finished, workers, slots=1, speedup=1.0):
+    """Estimate the work left in a run and the time until the workers are done with it
+
+    Args:
+        tasks (list): of tasks in queue order, each a list of feature names
+        estimates (dict): feature name to estimated duration in seconds
+        finished (set): names of feature files which have a result or were dead-lettered
+        workers (int): number of active workers
+        slots (int): number of Behat processes per worker
+        speedup (float): throughput of a worker with the slots relative to a worker with one slot
+
+    Returns:
+        tuple: remaining work and estimated time until it is done, both in seconds
+    """
+
+    durations = []
+    for task in tasks:
+        remaining = [estimates.get(feature, 0.0) for feature in task if feature not in finished]
+        if remaining:
+            durations.append(sum(remaining))
+    if not durations:
+        return 0.0, 0.0
+    return sum(durations), simulate_makespan(slot_durations(durations, slots, speedup), workers * slots)
+
+
+def select_sample(estimates, size):
+    """Select feature files spread evenly over the range of estimated durations for a benchmark
+
+    Args:
+        estimates (dict): feature name to estimated duration in seconds
+        size (int): number of feature files to select
+
+    Returns:
+        list: of feature names from the shortest to the longest
+    """
+
+    features = sorted(estimates, key=lambda name: (estimates[name], name))
+    if size >= len(features):
+        return features
+    step = float(len(features) - 1) / max(1, size - 1)
+    return [features[int(round(index * step))] for index in range(size)]
+
+
+def spread_workers(prices, max_workers):
+    """Spread the workers of a run over regions in proportion to how cheap their spot price is
+
+    Args:
+        prices (dict): region to spot price per hour of the regions within the maximum bid price
+        max_workers (int): number of workers of the run
+
+    Returns:
+        dict: region to number of workers. Regions without workers are left out
+    """
+
+    if not prices:
+        return {}
+
+    # A region half as cheap as the cheapest one gets half as many workers
+    cheapest = min(prices.values())
+    weights = dict([(region, cheapest / price if price else 1.0) for region, price in prices.items()])
+    total = sum(weights.values())
+    shares = dict([(region, max_workers * weight / total) for region, weight in weights.items()])
+
+    # Hand out the workers left over after rounding down to the regions with the largest remainder, cheapest first
+    allocation = dict([(region, int(share)) for region, share in shares.items()])
+    leftover = max_workers - sum(allocation.values())
+    for region in sorted(shares, key=lambda region: (allocation[region] - shares[region], prices[region]))[:leftover]:
+        allocation[region] += 1
+    return dict([(region, workers) for region, workers in allocation.items() if workers])
+
+
+def cap_workers(requested, cap):
+    """Scale down the workers of several runs in proportion to their request so they stay within a total
+
+    Args:
+        requested (list): number of workers requested by each run
+        cap (int): maximum number of workers across all runs
+
+    Returns:
+        list: number of workers of each run in the same order. Every run keeps at least one worker
+    """
+
+    # Every run needs a worker so more runs than the cap cannot be held to it
+    if len(requested) > cap:
+        raise ValueError('Cannot run %d profiles with at most %d workers in total' % (len(requested), cap))
+
+    if sum(requested) <= cap:
+        return list(requested)
+
+    # Every run keeps one worker and the rest of the cap is shared in proportion to the workers each run asked for
+    # beyond that. Hand out the workers left over after rounding down to the runs with the largest remainder
+    extra = [workers - 1 for workers in requested]
+    shares = [float(cap - len(requested)) * workers / sum(extra) for workers in extra]
+    allocation = [1 + int(share) for share in shares]
+    leftover = cap - sum(allocation)
+    for index in sorted(range(len(shares)), key=lambda index: int(shares[index]) - shares[index])[:leftover]:
+        allocation[index] += 1
+    return allocation
@@ -0,0 +1,152 @@
+import os
+import tarfile
+import zlib
+
+# zstd is optional. Without the zstandard package Beekeeper falls back to gzip
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File name suffixes of compressed result objects uploaded by Beeworker
+compression_suffixes = {'.gz': 'gzip', '.zst': 'zstd'}
+
+# Result objects uploaded in periodic archives by a Beeworker are stored under this prefix i.e. bundles/i-1234abcd-3.tar.gz
+bundle_prefix = 'bundles/'
+
+chunk_size = 65536
+
+
+def resolve_compression(compression):
+    """Get the compression Beeworker should use for the configured one
+
+    Args:
+        compression (str): none, gzip or zstd
+
+    Returns:
+        str: none, gzip or zstd. zstd becomes gzip if the zstandard package is not installed
+    """
+
+    compression = compression.lower()
+    if compression not in ('none', 'gzip', 'zstd'):
+        raise ValueError('Unknown result_compression %s. Use none, gzip or zstd' % compression)
+    if compression == 'zstd' and zstandard is None:
+        return 'gzip'
+    return compression
+
+
+def get_compression(key):
+    """Get the compression of a result object from its key
+
+    Args:
+        key (str): S3 key i.e. login.feature.result.gz
+
+    Returns:
+        tuple: key without the compression suffix and the compression i.e. ('login.feature.result', 'gzip')
+    """
+
+    for suffix, compression in compression_suffixes.items():
+        if key.endswith(suffix):
+            return key[:-len(suffix)], compression
+    return key, 'none'
+
+
+def read_chunks(stream):
+    """Read a file-like object in chunks until it is exhausted"""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def decompress_stream(stream, compression):
+    """Decompress a streamed object chunk by chunk so large results are never held in memory
+
+    Args:
+        stream (object): file-like object i.e. the Body of an S3 get_object response
+        compression (str): none, gzip or zstd
+
+    Returns:
+        generator: of decompressed chunks
+    """
+
+    if compression == 'gzip':
+        # 16 + MAX_WBITS makes zlib expect a gzip header and trailer
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for chunk in read_chunks(stream):
+            yield decompressor.decompress(chunk)
+        yield decompressor.flush()
+    elif compression == 'zstd':
+        for chunk in read_chunks(zstandard.ZstdDecompressor().stream_reader(stream)):
+            yield chunk
+    else:
+        for chunk in read_chunks(stream):
+            yield chunk
+
+
+def write_result(stream, key, result_folder):
+    """Write a single result object to the local result folder
+
+    Args:
+        stream (object): file-like object with the content of the object
+        key (str): S3 key i.e. login.feature.result or login.feature.result.gz
+        result_folder (str): local result folder of the run
+
+    Returns:
+        list: with the name of the written result file i.e. login.feature.result
+    """
+
+    filename, compression = get_compression(os.path.basename(key))
+    with open(result_folder + '/' + filename, 'wb') as f:
+        for chunk in decompress_stream(stream, compression):
+            f.write(chunk)
+    return [filename]
+
+
+def unpack_bundle(stream, key, result_folder):
+    """Unpack the result files of a bundle into the local result folder
+
+    Args:
+        stream (object): file-like object with the content of the bundle
+        key (str): S3 key i.e. bundles/i-1234abcd-3.tar.gz
+        result_folder (str): local result folder of the run
+
+    Returns:
+        list: of the names of the unpacked result files
+    """
+
+    name, compression = get_compression(key)
+    if compression == 'zstd':
+        archive = tarfile.open(fileobj=zstandard.ZstdDecompressor().stream_reader(stream), mode='r|')
+    else:
+        archive = tarfile.open(fileobj=stream, mode='r|gz' if compression == 'gzip' else 'r|')
+
+    filenames = []
+    for member in archive:
+        # Only take result files and never let a member name escape the result folder
+        filename = os.path.basename(member.name)
+        if not member.isfile() or not filename.endswith('.result'):
+            continue
+        with open(result_folder + '/' + filename, 'wb') as f:
+            for chunk in read_chunks(archive.extractfile(member)):
+                f.write(chunk)
+        filenames.append(filename)
+    archive.close()
+    return filenames
+
+
+def get_bundle_worker(key):
+    """Get the worker which uploaded a bundle from its key
+
+    Args:
+        key (str): S3 key i.e. bundles/i-1234abcd-3.tar.gz
+
+    Returns:
+        str: instance id of the worker i.e. i-1234abcd
+    """
+
+    name, compression = get_compression(os.path.basename(key))
+    if name.endswith('.tar'):
+        name = name[:-len('.tar')]
+    return name.rsplit('-', 1)[0]
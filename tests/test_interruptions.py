@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import boto3
+from botocore.stub import Stubber
+
+from beekeeper import aws
+
+config = '''[default]
+aws_access_key_id = test
+aws_secret_access_key = test
+aws_region = us-east-1
+aws_instance_id = i-0master
+behat_project_folder = /var/www/behat
+behat_result_folder = %s
+max_workers = 2
+max_bid_price = 0.1
+ssh_config_host = master
+timeout = 600
+'''
+
+
+class FindInterruptionsTest(unittest.TestCase):
+    """Classify the spot requests of a run from a stubbed describe_spot_instance_requests() response"""
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self.original_home = os.environ.get('HOME')
+        os.environ['HOME'] = self.home
+        os.makedirs(self.home + '/.beekeeper')
+        with open(self.home + '/.beekeeper/config.ini', 'w') as f:
+            f.write(config % (self.home + '/results'))
+        self.service = aws.AWS()
+
+    def tearDown(self):
+        if self.original_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = self.original_home
+        shutil.rmtree(self.home)
+
+    def describe_spot_requests(self, codes):
+        """Get a stubbed describe_spot_instance_requests() response with a spot request per status code"""
+
+        client = boto3.client('ec2', region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test')
+        stubber = Stubber(client)
+        stubber.add_response('describe_spot_instance_requests', {'SpotInstanceRequests': [
+            {
+                'SpotInstanceRequestId': 'sir-%d' % index,
+                'InstanceId': 'i-%d' % index,
+                'State': 'closed',
+                'Status': {'Code': code}
+            } for index, code in enumerate(codes)]})
+        with stubber:
+            return client.describe_spot_instance_requests()['SpotInstanceRequests']
+
+    def find(self, codes, handled=(), tasks_waiting=True):
+        requests = self.describe_spot_requests(codes)
+        interrupted = self.service.find_interruptions(requests, set(handled), tasks_waiting)
+        return [request['Status']['Code'] for request in interrupted]
+
+    def test_spot_service_interruptions(self):
+        codes = ['instance-terminated-by-price', 'instance-terminated-no-capacity', 'marked-for-termination']
+        self.assertEqual(self.find(codes), codes)
+
+    def test_user_termination_is_not_an_interruption(self):
+        self.assertEqual(self.find(['instance-terminated-by-user']), [])
+
+    def test_fulfilled_request_is_not_an_interruption(self):
+        self.assertEqual(self.find(['fulfilled']), [])
+
+    def test_handled_request_is_skipped(self):
+        self.assertEqual(self.find(['instance-terminated-by-price', 'marked-for-termination'], handled=['sir-0']),
+            ['marked-for-termination'])
+
+    def test_no_interruption_once_every_task_is_done(self):
+        self.assertEqual(self.find(['instance-terminated-by-price'], tasks_waiting=False), [])
+
+
+if __name__ == '__main__':
+    unittest.main()